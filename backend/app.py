@@ -3,16 +3,38 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, EmailStr
 from typing import Optional, List
 from datetime import date
+import datetime
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import Request
-from db_querries import make_booking, cancel_booking_by_id, check_availability, search_bookings_by_user
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from async_db_querries import make_booking, cancel_booking_by_id, check_availability, search_bookings_by_user
+from async_db_querries import iter_availability_batch, init_pool, close_pool, pool_stats
+from async_db_querries import check_availability_batch
+from db_querries import availability_cache, close_connection
+from slot_times import parse_slot, format_slot
 from ai_agent import extract_intent_entities
-from pinecone_search import query_pinecone
+from pinecone_search import query_embedding_cache
+from recommendations import recommend, recommendation_stats, bookable, AVAILABILITY_CANDIDATES
+from facet_index import get_facet_index, FACETS
 import re
 import json
 
-app = FastAPI()
+MAX_BATCH_RESTAURANTS = 100
+MAX_BATCH_DAYS = 62
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the database pool once per worker and close it on shutdown. The
+    # sync db_pool pool is opened lazily by the keyword / facet indexes and
+    # ranked lists, and is closed here too.
+    await init_pool()
+    yield
+    await close_pool()
+    close_connection()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for frontend to call this API
 app.add_middleware(
@@ -35,6 +57,32 @@ def parse_entities(json_str: str):
         return {}
 
 
+def parse_slot_or_400(text):
+    try:
+        return parse_slot(text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_ranges(data):
+    # {"cost": (min, max), ...} from the min_* / max_* request fields
+    ranges = {}
+    for field in ("cost", "rating", "rating_count"):
+        low, high = getattr(data, f"min_{field}", None), getattr(data, f"max_{field}", None)
+        if low is None and high is None:
+            continue
+        if low is not None and high is not None and low > high:
+            raise HTTPException(status_code=400, detail=f"min_{field} must not be greater than max_{field}")
+        ranges[field] = (low, high)
+    return ranges or None
+
+def parse_time_window(time_from, time_to):
+    from_minute = parse_slot_or_400(time_from) if time_from else 0
+    to_minute = parse_slot_or_400(time_to) if time_to else 1439
+    if from_minute > to_minute:
+        raise HTTPException(status_code=400, detail="time_from must not be after time_to")
+    return from_minute, to_minute
+
+
 # Pydantic models
 
 class IntentRequest(BaseModel):
@@ -48,6 +96,23 @@ class RecommendationRequest(BaseModel):
     user_query: str
     city: Optional[str] = None
     cuisine: Optional[str] = None
+    filters: Optional[dict] = None  # facet filter, e.g. {"feature": "Outdoor Seating", "cost_band": "budget"}
+    budget: Optional[int] = Field(None, gt=0)  # cost for two, used to rank by price fit
+    # Hard range filters, evaluated inside the vector store
+    min_cost: Optional[int] = Field(None, ge=0)
+    max_cost: Optional[int] = Field(None, ge=0)
+    min_rating: Optional[float] = Field(None, ge=0, le=5)
+    max_rating: Optional[float] = Field(None, ge=0, le=5)
+    min_rating_count: Optional[int] = Field(None, ge=0)
+    # Optional booking constraints: only restaurants with a free slot are returned
+    date: Optional[datetime.date] = None
+    number_of_people: Optional[int] = Field(1, gt=0)
+    time_from: Optional[str] = None
+    time_to: Optional[str] = None
+
+class SlotAvailability(BaseModel):
+    slot: str
+    remaining: int
 
 class RecommendationItem(BaseModel):
     id: str
@@ -55,16 +120,37 @@ class RecommendationItem(BaseModel):
     city: Optional[str]
     cuisines: List[str] = []
     features: List[str] = []
+    available_slots: Optional[List[SlotAvailability]] = None  # only when a date was given
 
 class RecommendationResponse(BaseModel):
     recommendations: List[RecommendationItem]
 
+class FacetRequest(BaseModel):
+    filters: Optional[dict] = None  # see facet_index.py for the filter format
+    facets: List[str] = list(FACETS)
+
+class FacetResponse(BaseModel):
+    total: int
+    facets: dict
+
 class AvailabilityRequest(BaseModel):
     restaurant_id: int
     date: date
+    number_of_people: Optional[int] = Field(1, gt=0)
+    time_from: Optional[str] = None  # e.g. "7 PM" or "19:00"
+    time_to: Optional[str] = None
 
 class AvailabilityResponse(BaseModel):
     available_slots: List[str]
+    slots: List[SlotAvailability] = []
+
+class BatchAvailabilityRequest(BaseModel):
+    restaurant_ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_RESTAURANTS)
+    start_date: date
+    end_date: date
+    number_of_people: Optional[int] = Field(1, gt=0)
+    time_from: Optional[str] = None
+    time_to: Optional[str] = None
 
 class BookingRequest(BaseModel):
     restaurant_id: int
@@ -120,8 +206,28 @@ def get_intent(data: IntentRequest):
     return intent_entities
 
 @app.post("/recommendations", response_model=RecommendationResponse)
-def get_recommendations(data: RecommendationRequest):
-    results = query_pinecone(data.user_query, city_filter=data.city, cuisine_filter=data.cuisine, top_k=3)
+async def get_recommendations(data: RecommendationRequest):
+    from_minute, to_minute = parse_time_window(data.time_from, data.time_to)
+    ranges = parse_ranges(data)
+    top_k = 3 if data.date is None else max(3, AVAILABILITY_CANDIDATES)
+    try:
+        results = await run_in_threadpool(
+            recommend, data.user_query, city=data.city, cuisine=data.cuisine, top_k=top_k,
+            filters=data.filters, budget=data.budget, ranges=ranges
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if data.date is not None:
+        # One availability query for all candidates, best-ranked bookable first
+        grid = {}
+        if results:
+            grid = await check_availability_batch(
+                [int(res["id"]) for res in results], data.date, data.date,
+                party_size=data.number_of_people, from_minute=from_minute, to_minute=to_minute
+            )
+        results = bookable(results or [], grid, data.date, top_k=3)
+
     recs = []
     for res in results or []:
         meta = res.get('metadata', {})
@@ -130,25 +236,68 @@ def get_recommendations(data: RecommendationRequest):
             name=meta.get("name"),
             city=meta.get("city"),
             cuisines=meta.get("cuisines", []),
-            features=meta.get("features", [])
+            features=meta.get("features", []),
+            available_slots=[
+                SlotAvailability(slot=format_slot(slot), remaining=remaining) for slot, remaining in res["slots"]
+            ] if "slots" in res else None
         ))
     return {"recommendations": recs}
 
+@app.post("/facets", response_model=FacetResponse)
+def get_facets(data: FacetRequest):
+    try:
+        return get_facet_index().facet_counts(data.filters, data.facets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/availability", response_model=AvailabilityResponse)
-def get_availability(data: AvailabilityRequest):
-    slots = check_availability(data.restaurant_id, data.date)
-    return {"available_slots": slots}
+async def get_availability(data: AvailabilityRequest):
+    from_minute, to_minute = parse_time_window(data.time_from, data.time_to)
+    slots = await check_availability(
+        data.restaurant_id, data.date, party_size=data.number_of_people,
+        from_minute=from_minute, to_minute=to_minute
+    )
+    return {
+        "available_slots": [format_slot(slot) for slot, _ in slots],
+        "slots": [SlotAvailability(slot=format_slot(slot), remaining=remaining) for slot, remaining in slots]
+    }
+
+@app.post("/availability/batch")
+async def get_availability_batch(data: BatchAvailabilityRequest):
+    days = (data.end_date - data.start_date).days + 1
+    if days < 1:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if days > MAX_BATCH_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_BATCH_DAYS} days")
+    from_minute, to_minute = parse_time_window(data.time_from, data.time_to)
+
+    # One JSON object per (restaurant, date) line, streamed as the query produces them
+    async def grid_lines():
+        async for restaurant_id, day, slots in iter_availability_batch(
+            data.restaurant_ids, data.start_date, data.end_date, party_size=data.number_of_people,
+            from_minute=from_minute, to_minute=to_minute
+        ):
+            yield json.dumps({
+                "restaurant_id": restaurant_id,
+                "date": day.isoformat(),
+                "available_slots": [format_slot(slot) for slot, _ in slots],
+                "slots": [{"slot": format_slot(slot), "remaining": remaining} for slot, remaining in slots]
+            }) + "\n"
+
+    return StreamingResponse(grid_lines(), media_type="application/x-ndjson")
 
 @app.post("/book", response_model=BookingResponse)
-def book(data: BookingRequest):
+async def book(data: BookingRequest):
+    start_minute = parse_slot_or_400(data.slot)
     try:
-        booking_id = make_booking(
+        booking_id = await make_booking(
             restaurant_id=data.restaurant_id,
             user_name=data.contact_name,
             contact_number=data.contact_number,
             email=data.contact_email,
             date=data.date,
-            slot=data.slot
+            start_minute=start_minute,
+            party_size=data.number_of_people
         )
 
         if booking_id:
@@ -160,7 +309,7 @@ def book(data: BookingRequest):
         else:
             return BookingResponse(
                 success=False,
-                message="Booking failed: Slot already booked",
+                message="Booking failed: Not enough seats left in this slot",
                 booking_id=None
             )
 
@@ -168,8 +317,8 @@ def book(data: BookingRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/cancel", response_model=CancelResponse)
-def cancel(data: CancelRequest):
-    success = cancel_booking_by_id(data.booking_id)
+async def cancel(data: CancelRequest):
+    success = await cancel_booking_by_id(data.booking_id)
     if success:
         return CancelResponse(
             success=True,
@@ -179,8 +328,8 @@ def cancel(data: CancelRequest):
         raise HTTPException(status_code=404, detail="Booking ID not found")
 
 @app.post("/bookings", response_model=GetBookingsResponse)
-def get_bookings(data: GetBookingsRequest):
-    bookings = search_bookings_by_user(data.contact_number, data.contact_email)
+async def get_bookings(data: GetBookingsRequest):
+    bookings = await search_bookings_by_user(data.contact_number, data.contact_email)
     result = []
     for b in bookings:
         result.append(BookingItem(
@@ -188,9 +337,21 @@ def get_bookings(data: GetBookingsRequest):
             restaurant_id=b[1],           # restaurant_id
             name=b[2],                    # restaurant name from JOIN
             date=b[3],                    # date
-            time_slot=b[4]                # slot
+            time_slot=format_slot(b[4])   # slot start minute
         ))
     return {"bookings": result}
 
+@app.get("/pool/stats")
+def get_pool_stats():
+    return pool_stats()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {
+        "availability": availability_cache.stats(),
+        "query_embeddings": query_embedding_cache.stats(),
+        "recommendations": recommendation_stats()
+    }
+
 
 # To run this API: uvicorn app:app --reload
@@ -0,0 +1,156 @@
+import os
+
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from db_querries import (
+    INSERT_BOOKING_SQL,
+    CANCEL_BOOKING_SQL,
+    USER_BOOKINGS_SQL,
+    AVAILABLE_SLOTS_SQL,
+    AVAILABILITY_GRID_SQL,
+    availability_cache,
+    slots_for_party,
+    cache_booking,
+    cache_cancellation,
+)
+
+# Async counterpart of db_querries used by the FastAPI routes, on psycopg 3.
+
+pool = None
+
+async def init_pool():
+    global pool
+    if pool is None:
+        pool = AsyncConnectionPool(
+            make_conninfo(
+                dbname=os.getenv("DB_NAME"),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+                host=os.getenv("DB_HOST"),
+                port=os.getenv("DB_PORT", 5432)
+            ),
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            max_lifetime=float(os.getenv("DB_POOL_MAX_AGE", 1800)),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+            check=AsyncConnectionPool.check_connection,
+            open=False
+        )
+        await pool.open()
+    return pool
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+def pool_stats():
+    return pool.get_stats() if pool is not None else {}
+
+async def make_booking(restaurant_id, user_name, contact_number, email, date, start_minute, party_size=1):
+    try:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(INSERT_BOOKING_SQL, {
+                "restaurant_id": restaurant_id,
+                "user_name": user_name,
+                "contact_number": contact_number,
+                "email": email,
+                "date": date,
+                "start_minute": start_minute,
+                "party_size": party_size,
+            })
+            row = await cursor.fetchone()
+        # The connection block has committed; only now touch the cache
+        if not row:
+            return None  # Not enough seats left in the slot
+        cache_booking(restaurant_id, date, start_minute, row[1])
+        return row[0]
+    except Exception as e:
+        print("Error in make_booking:", e)
+        raise
+
+async def cancel_booking_by_id(booking_id):
+    try:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(CANCEL_BOOKING_SQL, (booking_id,))
+            row = await cursor.fetchone()
+        if not row:
+            return False
+        cache_cancellation(*row)
+        return True
+    except Exception as e:
+        print("Error in cancel_booking_by_id:", e)
+        raise
+
+async def search_bookings_by_user(contact_number, email):
+    try:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(USER_BOOKINGS_SQL, (contact_number, email))
+            return await cursor.fetchall()
+    except Exception as e:
+        print("Error in search_bookings_by_user:", e)
+        raise
+
+async def check_availability(restaurant_id, date, party_size=1, from_minute=0, to_minute=1439):
+    cached = availability_cache.get((restaurant_id, date))
+    if cached is not None:
+        return slots_for_party(cached, party_size, from_minute, to_minute)
+    # A booking or cancellation committed while the slots load makes them
+    # stale; set_if_unchanged then leaves the entry for the next read
+    generation = availability_cache.generation()
+
+    try:
+        async with pool.connection() as conn:
+            # Load every slot with a free cover so the entry serves any party size
+            cursor = await conn.execute(AVAILABLE_SLOTS_SQL, {
+                "restaurant_id": restaurant_id,
+                "date": date,
+                "party_size": 1,
+            })
+            slots = tuple(await cursor.fetchall())
+        availability_cache.set_if_unchanged((restaurant_id, date), slots, generation)
+        # [(start_minute, remaining_covers)] for every slot that fits the party
+        return slots_for_party(slots, party_size, from_minute, to_minute)
+    except Exception as e:
+        print("Error in check_availability:", e)
+        raise
+
+async def iter_availability_batch(restaurant_ids, start_date, end_date, party_size=1,
+                                  from_minute=0, to_minute=1439):
+    # Yields (restaurant_id, date, [(start_minute, remaining_covers)]) per grid
+    # cell as rows arrive from the server, without buffering the whole grid.
+    try:
+        async with pool.connection() as conn:
+            params = {
+                "restaurant_ids": list(restaurant_ids),
+                "start_date": start_date,
+                "end_date": end_date,
+                "from_minute": from_minute,
+                "to_minute": to_minute,
+                "party_size": party_size,
+            }
+            current, slots = None, []
+            async for restaurant_id, day, start_minute, remaining in conn.cursor().stream(AVAILABILITY_GRID_SQL, params):
+                if (restaurant_id, day) != current:
+                    if current is not None:
+                        yield current[0], current[1], slots
+                    current, slots = (restaurant_id, day), []
+                slots.append((start_minute, remaining))
+            if current is not None:
+                yield current[0], current[1], slots
+    except Exception as e:
+        print("Error in iter_availability_batch:", e)
+        raise
+
+async def check_availability_batch(restaurant_ids, start_date, end_date, party_size=1,
+                                   from_minute=0, to_minute=1439):
+    # {(restaurant_id, date): [(start_minute, remaining_covers)]}, like the
+    # sync version in db_querries.py
+    grid = {}
+    async for restaurant_id, day, slots in iter_availability_batch(
+        restaurant_ids, start_date, end_date, party_size, from_minute, to_minute
+    ):
+        grid[(restaurant_id, day)] = slots
+    return grid
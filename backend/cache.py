@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # Bounded in-process cache: least recently used entries are evicted once
+    # maxsize is reached and every entry expires ttl seconds after it was set.
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        # Write numbers for set_if_unchanged: key -> number of the last
+        # update() / pop() on it, bounded like the entries. Keys that were
+        # pruned count as written at _written_floor.
+        self._writes = 0
+        self._written = OrderedDict()
+        self._written_floor = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "stale_sets": 0,
+        }
+
+    def _lookup(self, key):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self._stats["expirations"] += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self._stats["misses"] += 1
+                return default
+            self._stats["hits"] += 1
+            return value
+
+    def _set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        self._stats["sets"] += 1
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _record_write(self, key):
+        self._writes += 1
+        self._written[key] = self._writes
+        self._written.move_to_end(key)
+        while len(self._written) > self.maxsize:
+            _, self._written_floor = self._written.popitem(last=False)
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def generation(self):
+        # Take before reading a value from the source, then store it with
+        # set_if_unchanged
+        with self._lock:
+            return self._writes
+
+    def set_if_unchanged(self, key, value, generation):
+        # set() unless update() / pop() / clear() touched key after generation
+        # was taken: the loaded value may predate that write, so it is dropped
+        # and the next read loads again
+        with self._lock:
+            if self._written.get(key, self._written_floor) > generation:
+                self._stats["stale_sets"] += 1
+                return False
+            self._set(key, value)
+            return True
+
+    def update(self, key, func):
+        # Apply func to a live entry in place (keeping its expiry). If func
+        # returns None the entry is dropped instead. Either way loads already
+        # in flight for key will not be stored (see set_if_unchanged).
+        with self._lock:
+            self._record_write(key)
+            value = self._lookup(key)
+            if value is _MISSING:
+                return
+            new_value = func(value)
+            if new_value is None:
+                del self._data[key]
+                self._stats["invalidations"] += 1
+            else:
+                self._data[key] = (self._data[key][0], new_value)
+
+    def pop(self, key):
+        with self._lock:
+            self._record_write(key)
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._stats["invalidations"] += len(self._data)
+            self._data.clear()
+            self._writes += 1
+            self._written.clear()
+            self._written_floor = self._writes
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats.update({
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            })
+        return stats
+
+
+class SingleFlight:
+    # Request coalescing: concurrent calls with the same key share one
+    # execution of func; the first caller runs it, the others wait for its
+    # result (or its exception).
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"executions": 0, "coalesced": 0}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = func()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
@@ -1,163 +1,702 @@
-import psycopg2
+import argparse
+import csv
+import hashlib
+import io
 import json
 import os
+import queue
+import threading
+import time
 
-# Connect to your Postgres DB (update these values)
-conn = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT", 5432)
-)
-cursor = conn.cursor()
-
-# Create tables
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS restaurants (
-    id SERIAL PRIMARY KEY,
-    name TEXT NOT NULL,
-    city TEXT NOT NULL,
-    rating REAL,
-    rating_count INTEGER,
-    cost INTEGER,
-    lic_no TEXT,
-    address TEXT,
-    capacity INTEGER,
-    description TEXT,
-    opening_time TEXT,
-    closing_time TEXT
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS cuisines (
-    id SERIAL PRIMARY KEY,
-    name TEXT UNIQUE NOT NULL
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS restaurant_cuisines (
-    restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
-    cuisine_id INTEGER REFERENCES cuisines(id) ON DELETE CASCADE,
-    PRIMARY KEY (restaurant_id, cuisine_id)
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS features (
-    id SERIAL PRIMARY KEY,
-    name TEXT UNIQUE NOT NULL
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS restaurant_features (
-    restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
-    feature_id INTEGER REFERENCES features(id) ON DELETE CASCADE,
-    PRIMARY KEY (restaurant_id, feature_id)
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS slots (
-    id SERIAL PRIMARY KEY,
-    restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
-    time TEXT,
-    is_booked BOOLEAN DEFAULT FALSE
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS bookings (
-    booking_id SERIAL PRIMARY KEY,
-    restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
-    user_name TEXT,
-    contact_number TEXT,
-    email TEXT,
-    date DATE,
-    slot TEXT
-);
-""")
-
-conn.commit()
-
-# Load data
-with open('restaurants.json', 'r') as f:
-    data = json.load(f)
-
-def get_or_create_id(table, name):
-    cursor.execute(f"SELECT id FROM {table} WHERE name=%s;", (name,))
-    row = cursor.fetchone()
-    if row:
-        return row[0]
-    cursor.execute(f"INSERT INTO {table} (name) VALUES (%s) RETURNING id;", (name,))
-    new_id = cursor.fetchone()[0]
-    conn.commit()
-    return new_id
+import psycopg2
+
+from slot_times import parse_slot
+
+
+def get_connection():
+    return psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT", 5432)
+    )
 
-for restaurant in data:
-    # Insert restaurant basic info
+
+def create_schema(cursor):
     cursor.execute("""
-        INSERT INTO restaurants (
-            id, name, city, rating, rating_count, cost, lic_no,
-            address, capacity, description, opening_time, closing_time
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (id) DO UPDATE SET
-            name = EXCLUDED.name,
-            city = EXCLUDED.city,
-            rating = EXCLUDED.rating,
-            rating_count = EXCLUDED.rating_count,
-            cost = EXCLUDED.cost,
-            lic_no = EXCLUDED.lic_no,
-            address = EXCLUDED.address,
-            capacity = EXCLUDED.capacity,
-            description = EXCLUDED.description,
-            opening_time = EXCLUDED.opening_time,
-            closing_time = EXCLUDED.closing_time
-        ;
-    """, (
-        restaurant["id"],
-        restaurant["name"],
-        restaurant["city"],
-        restaurant.get("rating"),
-        restaurant.get("rating_count"),
-        restaurant.get("cost"),
-        restaurant.get("lic_no"),
-        restaurant.get("address"),
-        restaurant.get("capacity"),
-        restaurant.get("description"),
-        restaurant.get("opening_time"),
-        restaurant.get("closing_time"),
-    ))
-
-    # Insert cuisines and link to restaurant
-    for cuisine_name in restaurant["cuisine"]:
-        cuisine_id = get_or_create_id("cuisines", cuisine_name)
-        cursor.execute("""
-            INSERT INTO restaurant_cuisines (restaurant_id, cuisine_id)
-            VALUES (%s, %s) ON CONFLICT DO NOTHING;
-        """, (restaurant["id"], cuisine_id))
+    CREATE TABLE IF NOT EXISTS restaurants (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        city TEXT NOT NULL,
+        rating REAL,
+        rating_count INTEGER,
+        cost INTEGER,
+        lic_no TEXT,
+        address TEXT,
+        capacity INTEGER,
+        description TEXT,
+        opening_time TEXT,
+        closing_time TEXT,
+        source_hash TEXT
+    );
+    """)
+
+    # Fingerprint of the feed record each row was loaded from, see --sync
+    cursor.execute("ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS source_hash TEXT;")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cuisines (
+        id SERIAL PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS restaurant_cuisines (
+        restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
+        cuisine_id INTEGER REFERENCES cuisines(id) ON DELETE CASCADE,
+        PRIMARY KEY (restaurant_id, cuisine_id)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS features (
+        id SERIAL PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS restaurant_features (
+        restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
+        feature_id INTEGER REFERENCES features(id) ON DELETE CASCADE,
+        PRIMARY KEY (restaurant_id, feature_id)
+    );
+    """)
+
+    # Slots are minutes since midnight (see slot_times.py), one row per
+    # restaurant and start time, so they sort, range-filter and join as integers.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS slots (
+        id SERIAL PRIMARY KEY,
+        restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
+        start_minute SMALLINT NOT NULL CHECK (start_minute BETWEEN 0 AND 1439),
+        is_booked BOOLEAN DEFAULT FALSE,
+        retired_at TIMESTAMPTZ,
+        UNIQUE (restaurant_id, start_minute)
+    );
+    """)
+
+    # Set when a feed drops a slot that still has bookings: the row stays for
+    # those bookings but is no longer offered or bookable, see --sync
+    cursor.execute("ALTER TABLE slots ADD COLUMN IF NOT EXISTS retired_at TIMESTAMPTZ;")
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS bookings (
+        booking_id SERIAL PRIMARY KEY,
+        restaurant_id INTEGER REFERENCES restaurants(id) ON DELETE CASCADE,
+        user_name TEXT,
+        contact_number TEXT,
+        email TEXT,
+        date DATE,
+        slot_id INTEGER REFERENCES slots(id),
+        party_size INTEGER NOT NULL DEFAULT 1
+    );
+    """)
 
-    # Insert features and link to restaurant
-    for feature_name in restaurant.get("features", []):
-        feature_id = get_or_create_id("features", feature_name)
+    # === Migrate databases created with free-text slots ===
+    cursor.execute("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS party_size INTEGER NOT NULL DEFAULT 1;")
+    cursor.execute("""
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'slots' AND column_name = 'time';
+    """)
+    if cursor.fetchone():
+        cursor.execute("ALTER TABLE slots ADD COLUMN IF NOT EXISTS start_minute SMALLINT;")
+        cursor.execute("""
+        UPDATE slots
+        SET start_minute = EXTRACT(HOUR FROM t) * 60 + EXTRACT(MINUTE FROM t)
+        FROM (SELECT id AS slot_id, to_timestamp(time, 'HH12:MI AM')::time AS t FROM slots) parsed
+        WHERE slots.id = parsed.slot_id AND slots.start_minute IS NULL;
+        """)
+        cursor.execute("""
+        DELETE FROM slots a USING slots b
+        WHERE a.restaurant_id = b.restaurant_id AND a.start_minute = b.start_minute AND a.id > b.id;
+        """)
         cursor.execute("""
-            INSERT INTO restaurant_features (restaurant_id, feature_id)
-            VALUES (%s, %s) ON CONFLICT DO NOTHING;
-        """, (restaurant["id"], feature_id))
+        CREATE UNIQUE INDEX IF NOT EXISTS slots_restaurant_id_start_minute_key
+            ON slots (restaurant_id, start_minute);
+        """)
+        cursor.execute("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS slot_id INTEGER REFERENCES slots(id);")
+        cursor.execute("""
+        UPDATE bookings b SET slot_id = s.id
+        FROM slots s
+        WHERE b.slot_id IS NULL AND s.restaurant_id = b.restaurant_id
+          AND s.start_minute = EXTRACT(HOUR FROM to_timestamp(b.slot, 'HH12:MI AM')::time) * 60
+                             + EXTRACT(MINUTE FROM to_timestamp(b.slot, 'HH12:MI AM')::time);
+        """)
+        cursor.execute("ALTER TABLE slots ALTER COLUMN time DROP NOT NULL;")
+        cursor.execute("DROP INDEX IF EXISTS slots_restaurant_time_idx;")
+        cursor.execute("DROP INDEX IF EXISTS bookings_restaurant_date_idx;")
+        # The inventory is derived from bookings; rebuild it keyed by slot id below
+        cursor.execute("DROP TABLE IF EXISTS slot_inventory;")
+
+    # Remaining covers per (slot, date). Rows are created on the first booking
+    # from restaurants.capacity; the CHECK is what stops a slot from being
+    # oversold.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS slot_inventory (
+        slot_id INTEGER REFERENCES slots(id) ON DELETE CASCADE,
+        date DATE,
+        remaining INTEGER NOT NULL CHECK (remaining >= 0),
+        PRIMARY KEY (slot_id, date)
+    );
+    """)
+
+    # check_availability walks the slots unique index for one restaurant in
+    # start_minute order and probes the inventory primary key per slot, so the
+    # query never has to scan the bookings table. Bookings get a composite index
+    # for per-restaurant/date lookups.
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS bookings_restaurant_date_idx
+        ON bookings (restaurant_id, date);
+    """)
+
+    # Account for bookings made before the inventory existed
+    cursor.execute("""
+    INSERT INTO slot_inventory (slot_id, date, remaining)
+    SELECT b.slot_id, b.date, GREATEST(r.capacity - SUM(b.party_size), 0)
+    FROM bookings b
+    JOIN restaurants r ON r.id = b.restaurant_id
+    WHERE b.slot_id IS NOT NULL
+    GROUP BY b.slot_id, b.date, r.capacity
+    ON CONFLICT DO NOTHING;
+    """)
+
+
+# === Bulk loading ===
+# Every table is loaded with COPY into a temporary staging table followed by
+# one set-based INSERT ... SELECT, so a batch costs a handful of statements no
+# matter how many restaurants it holds.
+
+RESTAURANT_COLUMNS = [
+    "id", "name", "city", "rating", "rating_count", "cost", "lic_no",
+    "address", "capacity", "description", "opening_time", "closing_time",
+    "source_hash",
+]
+
+def fingerprint(record):
+    # Hash of everything the loader stores for a restaurant. List order does
+    # not matter to the schema, so lists are sorted before hashing.
+    stored = {column: record.get(column) for column in RESTAURANT_COLUMNS[:-1]}
+    stored["cuisine"] = sorted(record.get("cuisine", []))
+    stored["features"] = sorted(record.get("features", []))
+    stored["daily_slots"] = sorted(record.get("daily_slots", []))
+    return hashlib.sha256(json.dumps(stored, sort_keys=True).encode()).hexdigest()
+
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # NULLs are written as an unquoted empty field, see NULL '' below
+        writer.writerow(["" if value is None else value for value in row])
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')",
+        buffer
+    )
+
+def create_staging_tables(cursor):
+    cursor.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS stage_restaurants
+        (LIKE restaurants) ON COMMIT DELETE ROWS;
+    CREATE TEMP TABLE IF NOT EXISTS stage_restaurant_cuisines
+        (restaurant_id INTEGER, cuisine_id INTEGER) ON COMMIT DELETE ROWS;
+    CREATE TEMP TABLE IF NOT EXISTS stage_restaurant_features
+        (restaurant_id INTEGER, feature_id INTEGER) ON COMMIT DELETE ROWS;
+    CREATE TEMP TABLE IF NOT EXISTS stage_slots
+        (restaurant_id INTEGER, start_minute SMALLINT) ON COMMIT DELETE ROWS;
+    """)
+
+def load_dimension_ids(cursor, table):
+    cursor.execute(f"SELECT name, id FROM {table};")
+    return dict(cursor.fetchall())
+
+def resolve_dimension_ids(cursor, table, names, known_ids):
+    # known_ids is a name -> id dict kept in memory for the whole load; only
+    # names never seen before cost a (single, multi-row) INSERT.
+    missing = sorted({name for name in names if name not in known_ids})
+    if missing:
+        cursor.execute(f"""
+            INSERT INTO {table} (name)
+            SELECT unnest(%s::text[])
+            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING name, id;
+        """, (missing,))
+        known_ids.update(cursor.fetchall())
+    return known_ids
+
+def load_batch(cursor, records, cuisine_ids, feature_ids):
+    # Stage and upsert one batch of restaurant records. Returns the number of
+    # rows written across all tables; the caller owns the transaction.
+    # A repeated id keeps its last record, as the row-by-row upsert did.
+    records = list({r["id"]: r for r in records}.values())
+    resolve_dimension_ids(cursor, "cuisines", (c for r in records for c in r["cuisine"]), cuisine_ids)
+    resolve_dimension_ids(cursor, "features", (f for r in records for f in r.get("features", [])), feature_ids)
+
+    restaurant_rows = [
+        [r["id"], r["name"], r["city"]]
+        + [r.get(column) for column in RESTAURANT_COLUMNS[3:-1]]
+        + [fingerprint(r)]
+        for r in records
+    ]
+    cuisine_rows = {(r["id"], cuisine_ids[c]) for r in records for c in r["cuisine"]}
+    feature_rows = {(r["id"], feature_ids[f]) for r in records for f in r.get("features", [])}
+    slot_rows = set()
+    for r in records:
+        # Slots are parsed once here into minutes since midnight
+        for slot in r.get("daily_slots", []):
+            try:
+                slot_rows.add((r["id"], parse_slot(slot)))
+            except ValueError as e:
+                print(f"Skipping slot for restaurant {r['id']}:", e)
+
+    copy_rows(cursor, "stage_restaurants", RESTAURANT_COLUMNS, restaurant_rows)
+    copy_rows(cursor, "stage_restaurant_cuisines", ["restaurant_id", "cuisine_id"], cuisine_rows)
+    copy_rows(cursor, "stage_restaurant_features", ["restaurant_id", "feature_id"], feature_rows)
+    copy_rows(cursor, "stage_slots", ["restaurant_id", "start_minute"], slot_rows)
+
+    cursor.execute(f"""
+        INSERT INTO restaurants ({', '.join(RESTAURANT_COLUMNS)})
+        SELECT {', '.join(RESTAURANT_COLUMNS)} FROM stage_restaurants
+        ON CONFLICT (id) DO UPDATE SET
+            {', '.join(f"{c} = EXCLUDED.{c}" for c in RESTAURANT_COLUMNS[1:])};
+    """)
+    cursor.execute("""
+        INSERT INTO restaurant_cuisines (restaurant_id, cuisine_id)
+        SELECT restaurant_id, cuisine_id FROM stage_restaurant_cuisines
+        ON CONFLICT DO NOTHING;
+    """)
+    cursor.execute("""
+        INSERT INTO restaurant_features (restaurant_id, feature_id)
+        SELECT restaurant_id, feature_id FROM stage_restaurant_features
+        ON CONFLICT DO NOTHING;
+    """)
+    cursor.execute("""
+        INSERT INTO slots (restaurant_id, start_minute, is_booked)
+        SELECT restaurant_id, start_minute, FALSE FROM stage_slots
+        ON CONFLICT (restaurant_id, start_minute) DO UPDATE SET retired_at = NULL
+            WHERE slots.retired_at IS NOT NULL;
+    """)
+    # Empty the staging tables for the next batch in this transaction
+    cursor.execute("""
+    TRUNCATE stage_restaurants, stage_restaurant_cuisines,
+             stage_restaurant_features, stage_slots;
+    """)
+    return len(restaurant_rows) + len(cuisine_rows) + len(feature_rows) + len(slot_rows)
+
+def bulk_load(conn, records, batch_size=5000):
+    # Load every record inside one transaction: either the whole catalogue
+    # lands or nothing does.
+    start = time.perf_counter()
+    rows_written = 0
+    with conn.cursor() as cursor:
+        create_staging_tables(cursor)
+        cuisine_ids = load_dimension_ids(cursor, "cuisines")
+        feature_ids = load_dimension_ids(cursor, "features")
+        for i in range(0, len(records), batch_size):
+            rows_written += load_batch(cursor, records[i:i + batch_size], cuisine_ids, feature_ids)
+    conn.commit()
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {len(records)} restaurants ({rows_written} rows) in {elapsed:.2f}s "
+          f"({rows_written / elapsed if elapsed else 0:.0f} rows/sec)")
+    return rows_written
+
+
+# === Streaming ingestion ===
+# For partner feeds too large to json.load: records are parsed incrementally
+# from a JSON array or NDJSON file, validated, and written in batches that
+# each commit on their own. After every commit the number of records consumed
+# is checkpointed together with the feed's size and mtime, so an interrupted
+# load resumes after the last batch that made it in (re-applying a batch is
+# harmless, every write is an upsert) and a replaced feed starts over.
+
+# A single record larger than this is treated as a malformed feed (e.g. an
+# unterminated string) instead of being buffered until memory runs out
+MAX_RECORD_CHARS = int(os.getenv("FEED_MAX_RECORD_CHARS", 16 << 20))
+
+def iter_json_array(f, chunk_size=1 << 16, max_record_chars=MAX_RECORD_CHARS):
+    decoder = json.JSONDecoder()
+    buffer, pos = "", 0
+    opened = False
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos == len(buffer):
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError("Unexpected end of feed: JSON array is not closed")
+            buffer, pos = chunk, 0
+            continue
+        if not opened:
+            if buffer[pos] != "[":
+                raise ValueError("Feed is not a JSON array")
+            opened = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            record, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Record spans the chunk boundary: keep only the unparsed tail so
+            # memory stays bounded by one chunk plus the record being decoded.
+            if len(buffer) - pos > max_record_chars:
+                raise ValueError(f"Feed record exceeds {max_record_chars} characters without parsing; "
+                                 "the feed is malformed or a record is not terminated")
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield record
+
+def iter_ndjson(f):
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            # Keep the position count stable so checkpoints stay valid
+            yield ValueError(f"line {line_no}: {e}")
+
+def iter_feed_records(f, feed_format="auto"):
+    if feed_format == "auto":
+        first = ""
+        while not first.strip():
+            first = f.read(1)
+            if not first:
+                return
+        f.seek(0)
+        feed_format = "json" if first == "[" else "ndjson"
+    return iter_json_array(f) if feed_format == "json" else iter_ndjson(f)
+
+def validate_record(record):
+    # Returns a reason the record cannot be loaded, or None if it is fine
+    if isinstance(record, Exception):
+        return str(record)
+    if not isinstance(record, dict):
+        return "record is not a JSON object"
+    if not isinstance(record.get("id"), int):
+        return "missing integer 'id'"
+    for field in ("name", "city"):
+        if not isinstance(record.get(field), str) or not record[field].strip():
+            return f"restaurant {record['id']}: missing '{field}'"
+    for field in ("cuisine", "features", "daily_slots"):
+        if not isinstance(record.get(field, []), list):
+            return f"restaurant {record['id']}: '{field}' must be a list"
+    if "cuisine" not in record:
+        return f"restaurant {record['id']}: missing 'cuisine'"
+    for field in ("rating", "rating_count", "cost", "capacity"):
+        value = record.get(field)
+        if value is not None and not isinstance(value, (int, float)):
+            return f"restaurant {record['id']}: '{field}' must be a number"
+    return None
+
+def prefetch(iterable, depth=2):
+    # Produce items on a background thread, at most `depth` ahead, so parsing
+    # the next batch overlaps with writing the current one.
+    items = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        items.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+def feed_identity(feed_path):
+    # A new feed dropped at the same path must not resume the old one's count
+    stat = os.stat(feed_path)
+    return {"feed": os.path.abspath(feed_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def read_checkpoint(checkpoint_path, feed_path):
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0
+    identity = feed_identity(feed_path)
+    if any(checkpoint.get(key) != value for key, value in identity.items()):
+        if checkpoint.get("feed") == identity["feed"]:
+            print(f"Ignoring checkpoint {checkpoint_path}: {feed_path} has changed since it was written")
+        return 0
+    return checkpoint.get("records_done", 0)
+
+def write_checkpoint(checkpoint_path, feed_path, records_done):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(dict(feed_identity(feed_path), records_done=records_done), f)
+    os.replace(tmp_path, checkpoint_path)
+
+def stream_load(conn, path, batch_size=5000, feed_format="auto", checkpoint_path=None):
+    checkpoint_path = checkpoint_path or path + ".checkpoint"
+    skip = read_checkpoint(checkpoint_path, path)
+    if skip:
+        print(f"Resuming {path} after {skip} records")
 
-    # Insert slots
-    for slot in restaurant.get("daily_slots", []):
+    def batches(f):
+        # (records consumed so far, valid records) per batch
+        position, batch, rejected = 0, [], 0
+        for record in iter_feed_records(f, feed_format):
+            position += 1
+            if position <= skip:
+                continue
+            error = validate_record(record)
+            if error:
+                rejected += 1
+                print(f"Skipping record {position}: {error}")
+            else:
+                batch.append(record)
+            if len(batch) >= batch_size:
+                yield position, batch, rejected
+                batch, rejected = [], 0
+        if batch or rejected:
+            yield position, batch, rejected
+
+    start = time.perf_counter()
+    loaded = rejected_total = rows_written = 0
+    with open(path, "r") as f, conn.cursor() as cursor:
+        create_staging_tables(cursor)
+        cuisine_ids = load_dimension_ids(cursor, "cuisines")
+        feature_ids = load_dimension_ids(cursor, "features")
+        conn.commit()
+        for position, batch, rejected in prefetch(batches(f)):
+            try:
+                if batch:
+                    rows_written += load_batch(cursor, batch, cuisine_ids, feature_ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            write_checkpoint(checkpoint_path, path, position)
+            loaded += len(batch)
+            rejected_total += rejected
+            elapsed = time.perf_counter() - start
+            print(f"  {position} records read, {loaded} loaded, {rejected_total} rejected "
+                  f"({rows_written / elapsed if elapsed else 0:.0f} rows/sec)")
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    elapsed = time.perf_counter() - start
+    print(f"Streamed {loaded} restaurants ({rows_written} rows, {rejected_total} rejected) in {elapsed:.2f}s "
+          f"({rows_written / elapsed if elapsed else 0:.0f} rows/sec)")
+    return rows_written
+
+
+# === Delta sync ===
+# Compare each feed record's fingerprint with the source_hash stored for that
+# restaurant and only write what changed: new restaurants are inserted,
+# changed ones have their row, links and slots replaced (slots the feed
+# dropped but that still have bookings are retired instead of deleted, and a
+# new capacity is applied to future inventory), and restaurants no longer in
+# the feed are deleted. Everything happens in one transaction.
+# A feed that would remove more than SYNC_MAX_DELETE_FRACTION of the catalogue
+# (usually a truncated export) is refused unless --allow-deletes is given, and
+# restaurants that still have bookings are never deleted, only reported.
+
+SYNC_MAX_DELETE_FRACTION = float(os.getenv("SYNC_MAX_DELETE_FRACTION", 0.1))
+
+def replace_restaurant_details(cursor, records):
+    # Clear links and stale slots of changed restaurants before load_batch
+    # writes the new ones. Slots that still have bookings are retired, and
+    # future inventory is recounted against a changed capacity while the old
+    # one is still in restaurants.
+    ids = [r["id"] for r in records]
+    slot_rids, slot_minutes = [], []
+    for r in records:
+        for slot in r.get("daily_slots", []):
+            try:
+                minute = parse_slot(slot)
+            except ValueError:
+                continue
+            slot_rids.append(r["id"])
+            slot_minutes.append(minute)
+
+    cursor.execute("DELETE FROM restaurant_cuisines WHERE restaurant_id = ANY(%s);", (ids,))
+    cursor.execute("DELETE FROM restaurant_features WHERE restaurant_id = ANY(%s);", (ids,))
+    cursor.execute("""
+        DELETE FROM slots s
+        WHERE s.restaurant_id = ANY(%s)
+          AND (s.restaurant_id, s.start_minute) NOT IN (
+              SELECT * FROM unnest(%s::int[], %s::smallint[])
+          )
+          AND NOT EXISTS (SELECT 1 FROM bookings b WHERE b.slot_id = s.id);
+    """, (ids, slot_rids, slot_minutes))
+    cursor.execute("""
+        UPDATE slots s SET retired_at = now()
+        WHERE s.restaurant_id = ANY(%s)
+          AND s.retired_at IS NULL
+          AND (s.restaurant_id, s.start_minute) NOT IN (
+              SELECT * FROM unnest(%s::int[], %s::smallint[])
+          );
+    """, (ids, slot_rids, slot_minutes))
+
+    # Inventory rows hold capacity minus booked covers; recount the ones from
+    # today on for restaurants whose capacity changed
+    capacities = [(r["id"], r["capacity"]) for r in records if r.get("capacity") is not None]
+    if capacities:
         cursor.execute("""
-            INSERT INTO slots (restaurant_id, time, is_booked)
-            VALUES (%s, %s, FALSE)
-            ON CONFLICT DO NOTHING;
-        """, (restaurant["id"], slot))
+            UPDATE slot_inventory i
+            SET remaining = GREATEST(n.capacity - COALESCE((
+                SELECT SUM(b.party_size) FROM bookings b
+                WHERE b.restaurant_id = s.restaurant_id AND b.date = i.date AND b.slot_id = i.slot_id
+            ), 0), 0)
+            FROM slots s
+            JOIN restaurants r ON r.id = s.restaurant_id
+            JOIN unnest(%s::int[], %s::int[]) AS n(restaurant_id, capacity) ON n.restaurant_id = r.id
+            WHERE i.slot_id = s.id
+              AND i.date >= CURRENT_DATE
+              AND n.capacity IS DISTINCT FROM r.capacity;
+        """, ([rid for rid, _ in capacities], [capacity for _, capacity in capacities]))
+
+def sync_load(conn, path, batch_size=5000, feed_format="auto", dry_run=False, allow_deletes=False,
+              max_delete_fraction=SYNC_MAX_DELETE_FRACTION):
+    start = time.perf_counter()
+    changes = {"inserted": [], "updated": [], "deleted": [], "kept": []}
+    unchanged = rejected = rows_written = 0
+
+    with open(path, "r") as f, conn.cursor() as cursor:
+        cursor.execute("SELECT id, source_hash FROM restaurants;")
+        stored_hashes = dict(cursor.fetchall())
+        create_staging_tables(cursor)
+        cuisine_ids = load_dimension_ids(cursor, "cuisines")
+        feature_ids = load_dimension_ids(cursor, "features")
+
+        def apply(batch):
+            updated = [r for r in batch if r["id"] in stored_hashes]
+            if updated:
+                replace_restaurant_details(cursor, updated)
+            return load_batch(cursor, batch, cuisine_ids, feature_ids)
+
+        seen, batch = set(), []
+        for position, record in enumerate(iter_feed_records(f, feed_format), 1):
+            error = validate_record(record)
+            if error:
+                rejected += 1
+                print(f"Skipping record {position}: {error}")
+                # Still in the feed, just not loadable: keep what is stored
+                if isinstance(record, dict) and isinstance(record.get("id"), int):
+                    seen.add(record["id"])
+                continue
+            seen.add(record["id"])
+            stored = stored_hashes.get(record["id"], False)
+            if stored == fingerprint(record):
+                unchanged += 1
+                continue
+            changes["updated" if stored is not False else "inserted"].append(record["id"])
+            batch.append(record)
+            if len(batch) >= batch_size:
+                rows_written += 0 if dry_run else apply(batch)
+                batch = []
+        if batch and not dry_run:
+            rows_written += apply(batch)
+
+        missing = sorted(set(stored_hashes) - seen)
+        if missing:
+            cursor.execute("SELECT DISTINCT restaurant_id FROM bookings WHERE restaurant_id = ANY(%s);", (missing,))
+            booked = {row[0] for row in cursor.fetchall()}
+            changes["kept"] = [i for i in missing if i in booked]
+            changes["deleted"] = [i for i in missing if i not in booked]
+
+        if len(changes["deleted"]) > max_delete_fraction * len(stored_hashes) and not allow_deletes:
+            message = (f"Feed would delete {len(changes['deleted'])} of {len(stored_hashes)} restaurants "
+                       f"(limit {max_delete_fraction:.0%}); pass --allow-deletes if that is intended")
+            if not dry_run:
+                conn.rollback()
+                raise RuntimeError(message)
+            print(f"Warning: {message}")
+        if changes["deleted"] and not dry_run:
+            # Bookings may have arrived since the check above; the guard keeps them
+            cursor.execute("""
+                DELETE FROM restaurants r
+                WHERE r.id = ANY(%s)
+                  AND NOT EXISTS (SELECT 1 FROM bookings b WHERE b.restaurant_id = r.id)
+                RETURNING r.id;
+            """, (changes["deleted"],))
+            deleted = {row[0] for row in cursor.fetchall()}
+            changes["kept"] = sorted(changes["kept"] + [i for i in changes["deleted"] if i not in deleted])
+            changes["deleted"] = sorted(deleted)
+            rows_written += len(deleted)
+
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+
+    elapsed = time.perf_counter() - start
+    print(f"{'Dry run: ' if dry_run else ''}{len(changes['inserted'])} inserted, "
+          f"{len(changes['updated'])} updated, {len(changes['deleted'])} deleted, "
+          f"{len(changes['kept'])} kept for their bookings, {unchanged} unchanged, {rejected} rejected ({rows_written} rows written in {elapsed:.2f}s)")
+    for kind, ids in changes.items():
+        if ids:
+            shown = ", ".join(str(i) for i in ids[:20])
+            print(f"  {kind}: {shown}{' ...' if len(ids) > 20 else ''}")
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the schema and load restaurants into PostgreSQL")
+    parser.add_argument("path", nargs="?", default="restaurants.json")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--stream", action="store_true",
+                        help="parse the feed incrementally and commit per batch (for very large feeds)")
+    parser.add_argument("--format", choices=["auto", "json", "ndjson"], default="auto",
+                        help="feed format for --stream/--sync: a JSON array or one JSON object per line")
+    parser.add_argument("--checkpoint", help="checkpoint file for --stream (default: <path>.checkpoint)")
+    parser.add_argument("--sync", action="store_true",
+                        help="only apply restaurants added, changed or removed since the last load")
+    parser.add_argument("--dry-run", action="store_true", help="with --sync, report the change set without writing")
+    parser.add_argument("--allow-deletes", action="store_true",
+                        help="with --sync, apply deletions above SYNC_MAX_DELETE_FRACTION of the catalogue")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            create_schema(cursor)
+        conn.commit()
+
+        if args.sync:
+            sync_load(conn, args.path, batch_size=args.batch_size,
+                      feed_format=args.format, dry_run=args.dry_run, allow_deletes=args.allow_deletes)
+        elif args.stream:
+            stream_load(conn, args.path, batch_size=args.batch_size,
+                        feed_format=args.format, checkpoint_path=args.checkpoint)
+        else:
+            with open(args.path, 'r') as f:
+                data = json.load(f)
+            bulk_load(conn, data, batch_size=args.batch_size)
+    finally:
+        conn.close()
+
+    print("Data ingested successfully into PostgreSQL!")
 
-conn.commit()
-cursor.close()
-conn.close()
 
-print("Data ingested successfully into PostgreSQL!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, min_size=1, max_size=10, max_age=1800, timeout=30,
+                 check_idle_after=5, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size=%s max_size=%s" % (min_size, max_size))
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.check_idle_after = check_idle_after
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []        # [(conn, returned_at)], most recently returned last
+        self._created = {}     # id(conn) -> created_at, for every open connection
+        self._opening = 0
+        self._closed = False
+
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "in_use_peak": 0,
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "connections_recycled": 0,
+            "health_check_failures": 0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    # === Connection lifecycle ===
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _forget(self, conn):
+        self._created.pop(id(conn), None)
+        self._stats["connections_closed"] += 1
+
+    def _discard(self, conn):
+        self._forget(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _idle_state(self, conn, returned_at):
+        # Checks that need no round trip, made under the lock: "ok" to hand
+        # out, "ping" to verify first, "expired" to replace
+        if conn.closed:
+            return "expired"
+        created_at = self._created.get(id(conn), 0)
+        if self.max_age and time.monotonic() - created_at > self.max_age:
+            self._stats["connections_recycled"] += 1
+            return "expired"
+        # A connection handed back a moment ago is known to be good, only
+        # ping the ones that have been sitting idle for a while.
+        if time.monotonic() - returned_at < self.check_idle_after:
+            return "ok"
+        return "ping"
+
+    def _ping(self, conn):
+        # Called without the lock: a slow or hung server must not stall
+        # every other borrow and return
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # === Checkout / checkin ===
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        conn = None
+
+        while conn is None:
+            candidate, state = None, None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+
+                    if self._idle:
+                        candidate, returned_at = self._idle.pop()
+                        state = self._idle_state(candidate, returned_at)
+                        if state == "expired":
+                            self._forget(candidate)
+                            self._cond.notify()
+                        break
+
+                    if len(self._created) + self._opening < self.max_size:
+                        self._opening += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            "Timed out after %.1fs waiting for a database connection "
+                            "(pool max_size=%s)" % (self.timeout, self.max_size)
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if candidate is None:
+                # Open the new connection outside the lock so a slow handshake
+                # does not block other threads returning connections.
+                try:
+                    conn = self._connect()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+            elif state == "ok" or (state == "ping" and self._ping(candidate)):
+                conn = candidate
+            else:
+                # Still counted in _created while it was checked, so no other
+                # thread could open a connection in its place until now
+                if state == "ping":
+                    with self._cond:
+                        self._stats["health_check_failures"] += 1
+                        self._forget(candidate)
+                        self._cond.notify()
+                try:
+                    candidate.close()
+                except Exception:
+                    pass
+
+        with self._cond:
+            wait_time = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += wait_time
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+            if waited:
+                self._stats["waits"] += 1
+            in_use = len(self._created) - len(self._idle)
+            self._stats["in_use_peak"] = max(self._stats["in_use_peak"], in_use)
+        return conn
+
+    def putconn(self, conn):
+        # Never hand out a connection with an open or aborted transaction.
+        if not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+
+        with self._cond:
+            if self._closed or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    # === Statistics ===
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            size = len(self._created)
+            idle = len(self._idle)
+            stats.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": size,
+                "idle": idle,
+                "in_use": size - idle,
+                "saturation": (size - idle) / self.max_size,
+                "wait_time_avg": (stats["wait_time_total"] / stats["checkouts"]) if stats["checkouts"] else 0.0,
+            })
+        return stats
+
+
+# === Module-level pool shared by db_querries ===
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                min_size=int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+                max_size=int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+                max_age=float(os.getenv("DB_POOL_MAX_AGE", 1800)),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+                dbname=os.getenv("DB_NAME"),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+                host=os.getenv("DB_HOST"),
+                port=os.getenv("DB_PORT", 5432)
+            )
+    return _pool
+
+
+def get_pool():
+    # Scripts such as test.py never go through the FastAPI lifespan, so the
+    # pool is created lazily on first use as well.
+    return _pool if _pool is not None else init_pool()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    return _pool.stats() if _pool is not None else {}
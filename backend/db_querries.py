@@ -1,106 +1,241 @@
-import psycopg2
 import os
 
-def get_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT", 5432)
+from cache import TTLCache
+from db_pool import get_pool, close_pool
+
+# SQL shared with async_db_querries so both data-access layers stay identical
+
+# One atomic statement: take the seats from slot_inventory (creating the row
+# from restaurants.capacity on the first booking) and insert the booking only
+# if that succeeded. Concurrent bookings serialise on the inventory row.
+INSERT_BOOKING_SQL = """
+    WITH target_slot AS (
+        SELECT s.id, r.capacity
+        FROM slots s
+        JOIN restaurants r ON r.id = s.restaurant_id
+        WHERE s.restaurant_id = %(restaurant_id)s AND s.start_minute = %(start_minute)s
+          AND s.retired_at IS NULL
+    ), seats AS (
+        INSERT INTO slot_inventory AS i (slot_id, date, remaining)
+        SELECT target_slot.id, %(date)s, target_slot.capacity - %(party_size)s
+        FROM target_slot
+        WHERE target_slot.capacity >= %(party_size)s
+        ON CONFLICT (slot_id, date) DO UPDATE
+            SET remaining = i.remaining - %(party_size)s
+            WHERE i.remaining >= %(party_size)s
+        RETURNING i.slot_id, i.remaining
+    ), booked AS (
+        INSERT INTO bookings (
+            restaurant_id, user_name, contact_number, email, date, slot_id, party_size
+        )
+        SELECT %(restaurant_id)s, %(user_name)s, %(contact_number)s, %(email)s,
+               %(date)s, seats.slot_id, %(party_size)s
+        FROM seats
+        RETURNING booking_id
+    )
+    SELECT booked.booking_id, seats.remaining FROM booked, seats;
+"""
+
+# Delete the booking and give its seats back in the same statement
+CANCEL_BOOKING_SQL = """
+    WITH cancelled AS (
+        DELETE FROM bookings
+        WHERE booking_id = %s
+        RETURNING restaurant_id, date, slot_id, party_size
+    ), restored AS (
+        UPDATE slot_inventory i
+        SET remaining = i.remaining + c.party_size
+        FROM cancelled c
+        WHERE i.slot_id = c.slot_id AND i.date = c.date
+        RETURNING i.remaining
     )
+    SELECT c.restaurant_id, c.date, s.start_minute, r.remaining
+    FROM cancelled c
+    LEFT JOIN slots s ON s.id = c.slot_id
+    LEFT JOIN restored r ON TRUE;
+"""
+
+USER_BOOKINGS_SQL = """
+    SELECT b.booking_id, b.restaurant_id, r.name, b.date, s.start_minute
+    FROM bookings b
+    JOIN restaurants r ON b.restaurant_id = r.id
+    JOIN slots s ON b.slot_id = s.id
+    WHERE b.contact_number = %s AND b.email = %s
+    ORDER BY b.date, s.start_minute;
+"""
+
+# Slots with no inventory row yet have the restaurant's full capacity free.
+# Retired slots (dropped from the feed, kept for their bookings) are skipped.
+AVAILABLE_SLOTS_SQL = """
+    SELECT s.start_minute, COALESCE(i.remaining, r.capacity) AS remaining
+    FROM slots s
+    JOIN restaurants r ON r.id = s.restaurant_id
+    LEFT JOIN slot_inventory i ON i.slot_id = s.id AND i.date = %(date)s
+    WHERE s.restaurant_id = %(restaurant_id)s
+      AND s.retired_at IS NULL
+      AND COALESCE(i.remaining, r.capacity) >= %(party_size)s
+    ORDER BY s.start_minute;
+"""
+
+# The same lookup as AVAILABLE_SLOTS_SQL for many restaurants across a date
+# range and time window, ordered so callers can group rows per
+# (restaurant, date) as they stream.
+AVAILABILITY_GRID_SQL = """
+    SELECT s.restaurant_id, d.date, s.start_minute, COALESCE(i.remaining, r.capacity) AS remaining
+    FROM restaurants r
+    JOIN slots s ON s.restaurant_id = r.id
+    CROSS JOIN (
+        SELECT generate_series(%(start_date)s::date, %(end_date)s::date, interval '1 day')::date AS date
+    ) d
+    LEFT JOIN slot_inventory i ON i.slot_id = s.id AND i.date = d.date
+    WHERE r.id = ANY(%(restaurant_ids)s)
+      AND s.start_minute BETWEEN %(from_minute)s AND %(to_minute)s
+      AND s.retired_at IS NULL
+      AND COALESCE(i.remaining, r.capacity) >= %(party_size)s
+    ORDER BY s.restaurant_id, d.date, s.start_minute;
+"""
+
+# === Availability cache ===
+# (restaurant_id, date) -> ((start_minute, remaining_covers), ...) for every slot with
+# at least one free cover. Post-commit cache writes from concurrent requests can
+# run in any order, so a booking only ever lowers a slot's count (the smallest
+# remaining seen is the newest) and a cancellation drops the entry for the next
+# read to reload. The TTL bounds staleness from writes made by other workers.
+availability_cache = TTLCache(
+    maxsize=int(os.getenv("AVAILABILITY_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("AVAILABILITY_CACHE_TTL", 30))
+)
+
+def slots_for_party(slots, party_size, from_minute=0, to_minute=1439):
+    return [
+        (slot, remaining) for slot, remaining in slots
+        if remaining >= party_size and from_minute <= slot <= to_minute
+    ]
+
+def cache_booking(restaurant_id, date, slot, remaining):
+    def apply(slots):
+        updated = tuple((s, min(r, remaining) if s == slot else r) for s, r in slots)
+        return tuple((s, r) for s, r in updated if r > 0)
+    availability_cache.update((restaurant_id, date), apply)
+
+def cache_cancellation(restaurant_id, date, slot, remaining):
+    # A cancellation raises the count, which cannot be ordered against other
+    # bookings' writes; reload the entry instead
+    availability_cache.pop((restaurant_id, date))
 
-def make_booking(restaurant_id, user_name, contact_number, email, date, slot):
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
+def get_connection():
+    # Borrow a pooled connection; it is returned to the pool (not closed)
+    # when the `with` block exits.
+    return get_pool().connection()
 
-        cursor.execute("""
-            SELECT 1 FROM bookings
-            WHERE restaurant_id = %s AND date = %s AND slot = %s;
-        """, (restaurant_id, date, slot))
-
-        if cursor.fetchone():
-            return None  # Slot already booked
-
-        cursor.execute("""
-            INSERT INTO bookings (
-                restaurant_id, user_name, contact_number, email, date, slot
-            ) VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING booking_id;
-        """, (restaurant_id, user_name, contact_number, email, date, slot))
-
-        booking_id = cursor.fetchone()[0]
-        conn.commit()
-        return booking_id
-    except Exception as e:
-        print("Error in make_booking:", e)
-        conn.rollback()
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+def close_connection():
+    close_pool()
 
-def cancel_booking_by_id(booking_id):
-    try:
-        conn = get_connection()
+def make_booking(restaurant_id, user_name, contact_number, email, date, start_minute, party_size=1):
+    with get_connection() as conn:
         cursor = conn.cursor()
+        try:
+            cursor.execute(INSERT_BOOKING_SQL, {
+                "restaurant_id": restaurant_id,
+                "user_name": user_name,
+                "contact_number": contact_number,
+                "email": email,
+                "date": date,
+                "start_minute": start_minute,
+                "party_size": party_size,
+            })
+
+            row = cursor.fetchone()
+            conn.commit()
+            if not row:
+                return None  # Not enough seats left in the slot
+            cache_booking(restaurant_id, date, start_minute, row[1])
+            return row[0]
+        except Exception as e:
+            print("Error in make_booking:", e)
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
 
-        cursor.execute("""
-            DELETE FROM bookings
-            WHERE booking_id = %s;
-        """, (booking_id,))
-
-        deleted = cursor.rowcount
-        conn.commit()
-        return deleted > 0
-    except Exception as e:
-        print("Error in cancel_booking_by_id:", e)
-        conn.rollback()
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+def cancel_booking_by_id(booking_id):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(CANCEL_BOOKING_SQL, (booking_id,))
+
+            row = cursor.fetchone()
+            conn.commit()
+            if not row:
+                return False
+            cache_cancellation(*row)
+            return True
+        except Exception as e:
+            print("Error in cancel_booking_by_id:", e)
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
 
 def search_bookings_by_user(contact_number, email):
-    try:
-        conn = get_connection()
+    with get_connection() as conn:
         cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT b.booking_id, b.restaurant_id, r.name, b.date, b.slot
-            FROM bookings b
-            JOIN restaurants r ON b.restaurant_id = r.id
-            WHERE b.contact_number = %s AND b.email = %s;
-        """, (contact_number, email))
-
-        return cursor.fetchall()
-    except Exception as e:
-        print("Error in search_bookings_by_user:", e)
-        raise
-    finally:
-        cursor.close()
-        conn.close()
-
-def check_availability(restaurant_id, date):
-    try:
-        conn = get_connection()
+        try:
+            cursor.execute(USER_BOOKINGS_SQL, (contact_number, email))
+
+            return cursor.fetchall()
+        except Exception as e:
+            print("Error in search_bookings_by_user:", e)
+            raise
+        finally:
+            cursor.close()
+
+def check_availability(restaurant_id, date, party_size=1, from_minute=0, to_minute=1439):
+    cached = availability_cache.get((restaurant_id, date))
+    if cached is not None:
+        return slots_for_party(cached, party_size, from_minute, to_minute)
+    # A booking or cancellation committed while the slots load makes them
+    # stale; set_if_unchanged then leaves the entry for the next read
+    generation = availability_cache.generation()
+
+    with get_connection() as conn:
         cursor = conn.cursor()
-
-        cursor.execute("SELECT time FROM slots WHERE restaurant_id = %s;", (restaurant_id,))
-        all_slots = [row[0] for row in cursor.fetchall()]
-
-        cursor.execute("""
-            SELECT slot FROM bookings
-            WHERE restaurant_id = %s AND date = %s;
-        """, (restaurant_id, date))
-        booked_slots = [row[0] for row in cursor.fetchall()]
-
-        available_slots = list(set(all_slots) - set(booked_slots))
-        return sorted(available_slots)
-    except Exception as e:
-        print("Error in check_availability:", e)
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+        try:
+            # Load every slot with a free cover so the entry serves any party size
+            cursor.execute(AVAILABLE_SLOTS_SQL, {
+                "restaurant_id": restaurant_id,
+                "date": date,
+                "party_size": 1,
+            })
+            slots = tuple(cursor.fetchall())
+            availability_cache.set_if_unchanged((restaurant_id, date), slots, generation)
+            # [(start_minute, remaining_covers)] for every slot that fits the party
+            return slots_for_party(slots, party_size, from_minute, to_minute)
+        except Exception as e:
+            print("Error in check_availability:", e)
+            raise
+        finally:
+            cursor.close()
+
+def check_availability_batch(restaurant_ids, start_date, end_date, party_size=1, from_minute=0, to_minute=1439):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(AVAILABILITY_GRID_SQL, {
+                "restaurant_ids": list(restaurant_ids),
+                "start_date": start_date,
+                "end_date": end_date,
+                "from_minute": from_minute,
+                "to_minute": to_minute,
+                "party_size": party_size,
+            })
+            # {(restaurant_id, date): [(start_minute, remaining_covers)]}
+            grid = {}
+            for restaurant_id, day, start_minute, remaining in cursor.fetchall():
+                grid.setdefault((restaurant_id, day), []).append((start_minute, remaining))
+            return grid
+        except Exception as e:
+            print("Error in check_availability_batch:", e)
+            raise
+        finally:
+            cursor.close()
@@ -0,0 +1,65 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+# Persistent store of document embeddings keyed by a hash of the model name and
+# the exact text embedded, so re-indexing only pays for text that changed.
+# Vectors are kept as float32 blobs, the precision Pinecone stores them at.
+
+class EmbeddingCache:
+    def __init__(self, path=None):
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                embedding BLOB NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model, text):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT embedding FROM embeddings WHERE key = ?", (self.key(model, text),)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return array("f", row[0]).tolist()
+
+    def put(self, model, text, embedding):
+        self.put_many(model, [(text, embedding)])
+
+    def put_many(self, model, items):
+        rows = [(self.key(model, text), model, array("f", embedding).tobytes()) for text, embedding in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, embedding) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def get_or_embed(self, model, text, embed):
+        embedding = self.get(model, text)
+        if embedding is None:
+            embedding = embed(text)
+            self.put(model, text, embedding)
+        return embedding
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from db_pool import get_pool
+
+# In-memory facet index: one bitmap per (facet, value), bit i set when the
+# i-th restaurant has that value. Filters are bitwise AND/OR over Python
+# ints and counts are popcounts, so "Italian in Mumbai with outdoor seating"
+# plus counts for every other facet value is a handful of big-int operations
+# instead of a query per combination.
+#
+# Filters are dicts of facet -> value or list of values (values in a list
+# are ORed, facets are ANDed), nested with "and" / "or" lists:
+#   {"city": "Mumbai", "cuisine": ["Chinese", "Continental"]}
+#   {"or": [{"feature": "Sea View"}, {"rating_band": "4.5+"}]}
+#
+# The index also keeps rating, rating_count and cost as NumPy columns for
+# the re-ranking stage (rerank.py).
+
+FACETS = ("city", "cuisine", "feature", "cost_band", "rating_band")
+
+# (label, lower bound inclusive, upper bound exclusive); cost is for two
+COST_BANDS = [
+    ("budget", None, 500),
+    ("moderate", 500, 800),
+    ("premium", 800, None),
+]
+RATING_BANDS = [
+    ("below 3.5", None, 3.5),
+    ("3.5-4", 3.5, 4.0),
+    ("4-4.5", 4.0, 4.5),
+    ("4.5+", 4.5, None),
+]
+
+# === One row per restaurant with its cuisines and features ===
+FACET_ROWS_SQL = """
+    SELECT r.id, r.city, r.cost, r.rating, r.rating_count,
+           array_agg(DISTINCT c.name) AS cuisines,
+           array_agg(DISTINCT f.name) AS features
+    FROM restaurants r
+    LEFT JOIN restaurant_cuisines rc ON r.id = rc.restaurant_id
+    LEFT JOIN cuisines c ON rc.cuisine_id = c.id
+    LEFT JOIN restaurant_features rf ON r.id = rf.restaurant_id
+    LEFT JOIN features f ON rf.feature_id = f.id
+    GROUP BY r.id
+    ORDER BY r.id;
+"""
+
+def band(value, bands):
+    if value is None:
+        return None
+    for label, low, high in bands:
+        if (low is None or value >= low) and (high is None or value < high):
+            return label
+    return None
+
+
+class FacetIndex:
+    def __init__(self, rows):
+        # rows: (id, city, cost, rating, rating_count, cuisines, features)
+        self.ids = []
+        self.row_of = {}
+        numbers = []
+        self.bitmaps = {facet: {} for facet in FACETS}   # facet -> lower(value) -> bitmap
+        self.labels = {facet: {} for facet in FACETS}    # facet -> lower(value) -> value as stored
+
+        for restaurant_id, city, cost, rating, rating_count, cuisines, features in rows:
+            bit = 1 << len(self.ids)
+            self.row_of[restaurant_id] = len(self.ids)
+            self.ids.append(restaurant_id)
+            numbers.append((rating, rating_count, cost))
+            values = {
+                "city": [city],
+                "cuisine": cuisines or [],
+                "feature": features or [],
+                "cost_band": [band(cost, COST_BANDS)],
+                "rating_band": [band(rating, RATING_BANDS)],
+            }
+            for facet, facet_values in values.items():
+                for value in facet_values:
+                    if not value:
+                        continue
+                    key = value.lower()
+                    self.bitmaps[facet][key] = self.bitmaps[facet].get(key, 0) | bit
+                    self.labels[facet].setdefault(key, value)
+
+        self.all = (1 << len(self.ids)) - 1
+
+        # Missing values are NaN
+        columns = np.array(numbers, dtype=np.float64).reshape(-1, 3)
+        self.rating, self.rating_count, self.cost = columns.T
+
+    def __len__(self):
+        return len(self.ids)
+
+    def bitmap(self, filters=None):
+        # Bitmap of the restaurants matching a filter expression. Filters come
+        # straight from request bodies, so malformed ones raise ValueError
+        # (a 400 in app.py) rather than a TypeError deep in here.
+        if not filters:
+            return self.all
+        if not isinstance(filters, dict):
+            raise ValueError(f"Filter must be an object, got {type(filters).__name__}")
+        result = self.all
+        for key, value in filters.items():
+            if key in ("and", "or"):
+                if not isinstance(value, (list, tuple)):
+                    raise ValueError(f"{key!r} must be a list of filters")
+                bitmaps = [self.bitmap(sub_filter) for sub_filter in value]
+                if key == "and":
+                    for sub_bitmap in bitmaps:
+                        result &= sub_bitmap
+                else:
+                    any_of = 0
+                    for sub_bitmap in bitmaps:
+                        any_of |= sub_bitmap
+                    result &= any_of
+            elif key in self.bitmaps:
+                values = value if isinstance(value, (list, tuple)) else [value]
+                any_of = 0
+                for item in values:
+                    if not isinstance(item, (str, int, float)) or isinstance(item, bool):
+                        raise ValueError(f"Values of {key!r} must be strings or numbers")
+                    any_of |= self.bitmaps[key].get(str(item).lower(), 0)
+                result &= any_of
+            else:
+                raise ValueError(f"Unknown facet: {key!r}")
+        return result
+
+    def count(self, filters=None):
+        return self.bitmap(filters).bit_count()
+
+    def restaurant_ids(self, filters=None):
+        # Set bits in one pass over the bitmap's bytes; peeling bits off a
+        # big int one at a time would cost O(n) per matching restaurant
+        bitmap = self.bitmap(filters)
+        if not bitmap:
+            return []
+        packed = np.frombuffer(bitmap.to_bytes((len(self.ids) + 7) // 8, "little"), dtype=np.uint8)
+        return [self.ids[row] for row in np.flatnonzero(np.unpackbits(packed, bitorder="little"))]
+
+    def facet_counts(self, filters=None, facets=FACETS):
+        # Counts of every value of each facet within the filtered set
+        # (values with no matches are left out)
+        matched = self.bitmap(filters)
+        counts = {}
+        if isinstance(facets, str) or not isinstance(facets, (list, tuple)):
+            raise ValueError("facets must be a list of facet names")
+        for facet in facets:
+            if facet not in self.bitmaps:
+                raise ValueError(f"Unknown facet: {facet!r}")
+            facet_counts = {}
+            for key, bitmap in self.bitmaps[facet].items():
+                count = (bitmap & matched).bit_count()
+                if count:
+                    facet_counts[self.labels[facet][key]] = count
+            counts[facet] = dict(sorted(facet_counts.items(), key=lambda item: -item[1]))
+        return {"total": matched.bit_count(), "facets": counts}
+
+
+def build_facet_index(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(FACET_ROWS_SQL)
+        return FacetIndex(cursor.fetchall())
+
+# One index per worker, rebuilt from the database at most every
+# FACET_INDEX_TTL seconds so rating / cost / feature changes show up
+# without a restart. One thread rebuilds outside the lock while the others
+# keep using the current index; they only wait when there is none yet.
+FACET_INDEX_TTL = float(os.getenv("FACET_INDEX_TTL", 300))
+_facet_index = None
+_facet_index_built_at = float("-inf")
+_facet_index_lock = threading.Lock()
+_facet_index_build_lock = threading.Lock()
+
+def get_facet_index():
+    global _facet_index, _facet_index_built_at
+    if time.monotonic() - _facet_index_built_at < FACET_INDEX_TTL:
+        return _facet_index
+    if not _facet_index_build_lock.acquire(blocking=_facet_index is None):
+        return _facet_index   # another thread is rebuilding
+    try:
+        if time.monotonic() - _facet_index_built_at >= FACET_INDEX_TTL:
+            with get_pool().connection() as conn:
+                facet_index = build_facet_index(conn)
+            with _facet_index_lock:
+                _facet_index, _facet_index_built_at = facet_index, time.monotonic()
+    finally:
+        _facet_index_build_lock.release()
+    return _facet_index
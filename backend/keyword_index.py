@@ -0,0 +1,147 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from db_pool import get_pool
+from restaurant_documents import iter_documents
+from vector_store import in_ranges
+
+# BM25 inverted index over restaurant name, description, cuisines and
+# features, built from the documents pinecone_upload.py embeds. It finds
+# exact terms ("rooftop", "Valet Parking") that embeddings can blur, and
+# short queries whose terms all match enough restaurants are answered from
+# it alone, without an embedding call (see pinecone_search.hybrid_search).
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Name, cuisine and feature terms count this many times per occurrence, so a
+# restaurant that lists "Valet Parking" beats one that mentions valets once
+FACET_TERM_WEIGHT = 2
+
+STOPWORDS = {
+    "a", "an", "and", "any", "at", "best", "for", "good", "i", "in", "is", "me",
+    "near", "of", "on", "or", "place", "places", "restaurant", "restaurants",
+    "some", "the", "to", "want", "with",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall((text or "").lower()) if token not in STOPWORDS]
+
+
+class KeywordIndex:
+    def __init__(self, documents):
+        # documents: (id, text, metadata) tuples as built by
+        # restaurant_documents.build_document
+        self.ids = []
+        self.metadata = []
+        self.postings = {}   # term -> {row: weighted term frequency}
+        lengths = []
+
+        for doc_id, text, metadata in documents:
+            row = len(self.ids)
+            self.ids.append(doc_id)
+            self.metadata.append(metadata)
+
+            facet_text = " ".join([metadata.get("name") or ""] + metadata.get("cuisines", []) + metadata.get("features", []))
+            counts = Counter(tokenize(text))
+            for term in tokenize(facet_text):
+                counts[term] += FACET_TERM_WEIGHT
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[row] = count
+            lengths.append(sum(counts.values()))
+
+        self.lengths = lengths
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        n = len(self.ids)
+        self.idf = {
+            term: math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            for term, rows in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _allowed(self, row, city, cuisine, restaurant_ids=None, ranges=None):
+        metadata = self.metadata[row]
+        if restaurant_ids is not None and metadata.get("restaurant_id") not in restaurant_ids:
+            return False
+        if city and metadata.get("city") != city:
+            return False
+        if cuisine and cuisine not in (metadata.get("cuisines") or []):
+            return False
+        return in_ranges(metadata, ranges)
+
+    def scores(self, terms, city=None, cuisine=None, restaurant_ids=None, ranges=None):
+        # row -> BM25 score, for rows matching at least one term
+        scores = {}
+        for term in set(terms):
+            rows = self.postings.get(term)
+            if not rows:
+                continue
+            idf = self.idf[term]
+            for row, tf in rows.items():
+                if not self._allowed(row, city, cuisine, restaurant_ids, ranges):
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[row] / self.avg_length)
+                scores[row] = scores.get(row, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query_text, top_k=3, city=None, cuisine=None, restaurant_ids=None, ranges=None):
+        # Matches in the same {"id", "score", "metadata"} shape as the vector
+        # stores; scores are divided by the best one so they fall in (0, 1]
+        scores = self.scores(tokenize(query_text), city, cuisine, restaurant_ids, ranges)
+        best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        top = scores[best[0]] if best else 1.0
+        return [
+            {"id": self.ids[row], "score": scores[row] / top, "metadata": self.metadata[row]}
+            for row in best
+        ]
+
+    def full_matches(self, query_text, city=None, cuisine=None, restaurant_ids=None, ranges=None):
+        # Number of restaurants containing every query term
+        terms = set(tokenize(query_text))
+        if not terms:
+            return 0
+        rows = None
+        for term in terms:
+            term_rows = set(self.postings.get(term, ()))
+            rows = term_rows if rows is None else rows & term_rows
+            if not rows:
+                return 0
+        return sum(1 for row in rows if self._allowed(row, city, cuisine, restaurant_ids, ranges))
+
+
+def build_keyword_index(conn):
+    return KeywordIndex(iter_documents(conn))
+
+# One index per worker, built from the database on first use and dropped
+# when the vector index version changes. KEYWORD_INDEX_ENABLED=0 turns
+# hybrid retrieval off; so does a failed build, until the next re-index.
+_keyword_index = None
+_keyword_index_failed = False
+_keyword_index_lock = threading.Lock()
+
+def get_keyword_index():
+    global _keyword_index, _keyword_index_failed
+    if os.getenv("KEYWORD_INDEX_ENABLED", "1") == "0":
+        return None
+    if _keyword_index is None and not _keyword_index_failed:
+        with _keyword_index_lock:
+            if _keyword_index is None and not _keyword_index_failed:
+                try:
+                    with get_pool().connection() as conn:
+                        _keyword_index = build_keyword_index(conn)
+                except Exception as e:
+                    print("Failed to build keyword index, using vector search only:", e)
+                    _keyword_index_failed = True
+    return _keyword_index
+
+def reset_keyword_index():
+    global _keyword_index, _keyword_index_failed
+    with _keyword_index_lock:
+        _keyword_index = None
+        _keyword_index_failed = False
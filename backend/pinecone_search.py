@@ -1,12 +1,48 @@
-from pinecone import Pinecone
 import os
+import re
+import threading
+import time
 from google.generativeai import configure, embed_content
+from cache import TTLCache
+from vector_store import create_vector_store, read_index_manifest, INDEX_POLL_SECONDS
+from keyword_index import get_keyword_index, reset_keyword_index, tokenize
+from query_planner import count_route
 
 configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index_name = os.getenv("PINECONE_INDEX_NAME")
-index = pc.Index(index_name)
+# Pinecone, or a local in-process index, picked by VECTOR_STORE_BACKEND
+# (see vector_store.py). Created on first query.
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+def get_vector_store():
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = create_vector_store()
+    return _vector_store
+
+# Version of the vector index from the manifest pinecone_upload.py writes,
+# re-read at most every VECTOR_INDEX_POLL_SECONDS. A new version means the
+# catalogue was re-indexed: the store and the keyword index are reloaded on
+# the next query.
+_index_version = None
+_index_checked_at = float("-inf")
+
+def current_index_version():
+    global _index_version, _index_checked_at, _vector_store
+    now = time.monotonic()
+    if now - _index_checked_at >= INDEX_POLL_SECONDS:
+        _index_checked_at = now
+        version = read_index_manifest().get("version")
+        if version != _index_version:
+            with _vector_store_lock:
+                if _index_version is not None:
+                    _vector_store = None
+                    reset_keyword_index()
+                _index_version = version
+    return _index_version
 
 def get_embedding(text):
     result = embed_content(
@@ -16,24 +52,86 @@ def get_embedding(text):
     )
     return result["embedding"]
 
+# Query embeddings shared by every request in this worker. Keys are the
+# normalised query, so "Romantic dinner in Delhi " and "romantic dinner in
+# delhi" reuse one embedding.
+query_embedding_cache = TTLCache(
+    maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 2048)),
+    ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", 3600))
+)
+
+def normalize_query(text):
+    return " ".join(re.sub(r"[^\w\s]", " ", (text or "").lower()).split())
+
+def get_query_embedding(query_text):
+    key = normalize_query(query_text)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = get_embedding(key)
+        query_embedding_cache.set(key, embedding)
+    return embedding
+
 def normalize_text(text):
     if not text:
         return text
     return " ".join(word.capitalize() for word in text.split())
 
-def query_pinecone(query_text, city_filter=None, cuisine_filter=None, top_k=3):
-    query_embedding = get_embedding(query_text)
-    filters = {}
+def query_pinecone(query_text, city_filter=None, cuisine_filter=None, top_k=3, restaurant_ids=None, ranges=None):
+    query_embedding = get_query_embedding(query_text)
     if city_filter:
         city_filter = normalize_text(city_filter)  # Normalize city filter case
-        filters["city"] = {"$eq": city_filter}
     if cuisine_filter:
         cuisine_filter = normalize_text(cuisine_filter)  # Normalize cuisine filter case
-        filters["cuisines"] = {"$in": [cuisine_filter]}
-    results = index.query(
-        vector=query_embedding,
+    return get_vector_store().query(
+        query_embedding,
         top_k=top_k,
-        filter=filters if filters else None,
-        include_metadata=True
+        city=city_filter,
+        cuisine=cuisine_filter,
+        restaurant_ids=restaurant_ids,
+        ranges=ranges
     )
-    return results.matches
+
+# === Hybrid retrieval: BM25 keyword index (keyword_index.py) + vectors ===
+# Short queries whose terms all appear in at least min_results restaurants are
+# answered from the keyword index alone, with no embedding call. Otherwise
+# both retrievers fetch HYBRID_CANDIDATES x top_k candidates and the scores
+# are blended: (1 - w) * cosine + w * normalised BM25.
+KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", 0.3))
+LEXICAL_MAX_TERMS = int(os.getenv("HYBRID_LEXICAL_MAX_TERMS", 2))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 4))
+
+def fuse_matches(vector_matches, keyword_matches, keyword_weight=KEYWORD_WEIGHT):
+    fused = {}
+    for match in vector_matches:
+        fused[match["id"]] = {"id": match["id"], "score": (1 - keyword_weight) * match["score"],
+                              "metadata": match["metadata"]}
+    for match in keyword_matches:
+        entry = fused.setdefault(match["id"], {"id": match["id"], "score": 0.0, "metadata": match["metadata"]})
+        entry["score"] += keyword_weight * match["score"]
+    return sorted(fused.values(), key=lambda match: match["score"], reverse=True)
+
+def hybrid_search(query_text, city_filter=None, cuisine_filter=None, top_k=3, restaurant_ids=None,
+                  min_results=None, ranges=None):
+    # restaurant_ids: optional prefilter, e.g. from facet_index.py.
+    # ranges: numeric range filters, see vector_store.py.
+    # min_results: how many full keyword matches make a lexical answer good
+    # enough (default top_k; lower when over-fetching for re-ranking)
+    keyword_index = get_keyword_index()
+    if keyword_index is None:
+        count_route("vector_only")
+        return query_pinecone(query_text, city_filter, cuisine_filter, top_k, restaurant_ids, ranges)
+    if restaurant_ids is not None:
+        restaurant_ids = set(restaurant_ids)
+
+    city = normalize_text(city_filter) if city_filter else None
+    cuisine = normalize_text(cuisine_filter) if cuisine_filter else None
+    if (0 < len(set(tokenize(query_text))) <= LEXICAL_MAX_TERMS
+            and keyword_index.full_matches(query_text, city, cuisine, restaurant_ids, ranges) >= (min_results or top_k)):
+        count_route("keyword_only")
+        return keyword_index.search(query_text, top_k, city, cuisine, restaurant_ids, ranges)
+
+    count_route("hybrid")
+    candidates = top_k * HYBRID_CANDIDATES
+    vector_matches = query_pinecone(query_text, city, cuisine, candidates, restaurant_ids, ranges)
+    keyword_matches = keyword_index.search(query_text, candidates, city, cuisine, restaurant_ids, ranges)
+    return fuse_matches(vector_matches, keyword_matches)[:top_k]
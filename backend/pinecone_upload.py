@@ -1,8 +1,19 @@
+import argparse
+import json
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
 import psycopg2
 from dotenv import load_dotenv
 from google.generativeai import configure, embed_content
 from pinecone import Pinecone, ServerlessSpec
+from embedding_cache import EmbeddingCache
+from restaurant_documents import iter_documents
+from vector_store import save_snapshot, write_index_manifest, city_namespace
+from vector_store import live_index_name, live_snapshot_path
 
 # === Load environment variables ===
 load_dotenv()
@@ -10,90 +21,209 @@ load_dotenv()
 # === Configure Gemini ===
 configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
+EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_DIMENSION = 768
+
+# === Pipeline tuning ===
+EMBED_BATCH_SIZE = int(os.getenv("UPLOAD_EMBED_BATCH_SIZE", 50))  # texts per embed_content call
+UPSERT_BATCH_SIZE = int(os.getenv("UPLOAD_UPSERT_BATCH_SIZE", 100))  # vectors per index.upsert call
+EMBED_CONCURRENCY = int(os.getenv("UPLOAD_EMBED_CONCURRENCY", 4))
+# One Pinecone namespace per city (see vector_store.py)
+PARTITION_BY_CITY = os.getenv("VECTOR_PARTITION_BY_CITY", "0") == "1"
+MAX_ATTEMPTS = 5
+
+def get_connection():
+    return psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT", 5432)
+    )
+
 # === Function to get embedding from Gemini 1.5 Flash ===
 def get_embedding(text):
     result = embed_content(
-        model="models/embedding-001",
+        model=EMBEDDING_MODEL,
         content=text,
         task_type="retrieval_document"
     )
     return result["embedding"]
 
-# === Connect to PostgreSQL ===
-conn = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT", 5432)
-)
-cursor = conn.cursor()
-
-# === Initialize Pinecone client ===
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-
-index_name = os.getenv("PINECONE_INDEX_NAME")
-pinecone_env = os.getenv("PINECONE_ENVIRONMENT")  # (Optional if you want to use it)
-
-# Check if index exists, create if not
-if index_name not in pc.list_indexes().names():
-    pc.create_index(
-        name=index_name,
-        dimension=768,  # Gemini embedding dimension
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud="aws",      # Adjust if your environment is different
-            region="us-west-2"  # Adjust to your Pinecone environment region
-        )
+def get_embeddings(texts):
+    # One API call for the whole list
+    result = embed_content(
+        model=EMBEDDING_MODEL,
+        content=texts,
+        task_type="retrieval_document"
     )
+    return result["embedding"]
 
-# Connect to the index
-index = pc.Index(index_name)
-
-# === Fetch restaurant data with cuisines and features ===
-cursor.execute("""
-    SELECT r.id, r.name, r.city, r.description,
-           array_agg(DISTINCT c.name) AS cuisines,
-           array_agg(DISTINCT f.name) AS features
-    FROM restaurants r
-    LEFT JOIN restaurant_cuisines rc ON r.id = rc.restaurant_id
-    LEFT JOIN cuisines c ON rc.cuisine_id = c.id
-    LEFT JOIN restaurant_features rf ON r.id = rf.restaurant_id
-    LEFT JOIN features f ON rf.feature_id = f.id
-    GROUP BY r.id;
-""")
-rows = cursor.fetchall()
-
-# === Prepare and upsert embeddings ===
-vectors = []
-
-for row in rows:
-    restaurant_id, name, city, description, cuisines, features = row
-
-    if not description:
-        continue
-
-    cuisines_str = ", ".join(cuisines) if cuisines else ""
-    features_str = ", ".join(features) if features else ""
-
-    combined_text = f"{description}\nCuisines: {cuisines_str}\nFeatures: {features_str}"
-
-    metadata = {
-        "restaurant_id": restaurant_id,
-        "name": name,
-        "city": city,
-        "cuisines": cuisines,
-        "features": features,
-    }
-
-    embedding = get_embedding(combined_text)
-    vectors.append((str(restaurant_id), embedding, metadata))
-
-# Upsert vectors to Pinecone index
-index.upsert(vectors)
-
-print("Embeddings successfully inserted into Pinecone.")
-
-# === Cleanup ===
-cursor.close()
-conn.close()
+def with_retry(func, *args, description="request"):
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            delay = 2 ** (attempt - 1)
+            print(f"⚠️ {description} failed ({e}), retrying in {delay}s ({attempt}/{MAX_ATTEMPTS})")
+            time.sleep(delay)
+
+def ensure_index(pc, index_name):
+    # Check if index exists, create if not
+    if index_name not in pc.list_indexes().names():
+        pc.create_index(
+            name=index_name,
+            dimension=EMBEDDING_DIMENSION,  # Gemini embedding dimension
+            metric="cosine",
+            spec=ServerlessSpec(
+                cloud="aws",      # Adjust if your environment is different
+                region="us-west-2"  # Adjust to your Pinecone environment region
+            )
+        )
+    return pc.Index(index_name)
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def embed_documents(documents, cache):
+    # Embed one batch: cached texts are reused, the rest go out in one call
+    texts = [text for _, text, _ in documents]
+    embeddings = [cache.get(EMBEDDING_MODEL, text) for text in texts]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        fresh = with_retry(get_embeddings, [texts[i] for i in missing], description="Embedding batch")
+        cache.put_many(EMBEDDING_MODEL, [(texts[i], embedding) for i, embedding in zip(missing, fresh)])
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+    return [(doc_id, embedding, metadata) for (doc_id, _, metadata), embedding in zip(documents, embeddings)]
+
+# === Checkpointing: id of the last restaurant whose vector is in the index ===
+
+def read_checkpoint(checkpoint_path, index_name):
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0
+    return checkpoint.get("last_id", 0) if checkpoint.get("index") == index_name else 0
+
+def write_checkpoint(checkpoint_path, index_name, last_id):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"index": index_name, "last_id": last_id}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def upsert_vectors(index, vectors, partition_by_city=PARTITION_BY_CITY):
+    if not partition_by_city:
+        for chunk in batched(vectors, UPSERT_BATCH_SIZE):
+            with_retry(index.upsert, chunk, description="Upsert")
+        return
+    by_namespace = {}
+    for vector in vectors:
+        by_namespace.setdefault(city_namespace(vector[2].get("city")), []).append(vector)
+    for namespace, namespace_vectors in by_namespace.items():
+        for chunk in batched(namespace_vectors, UPSERT_BATCH_SIZE):
+            with_retry(lambda: index.upsert(vectors=chunk, namespace=namespace), description="Upsert")
+
+def upload(index, index_name, conn, cache, checkpoint_path, concurrency=EMBED_CONCURRENCY,
+           snapshot_path=None):
+    # rows -> embedding batches (up to `concurrency` in flight) -> chunked
+    # upserts. Batches are upserted in id order, so once one is written the
+    # checkpoint can safely move to its last id. With snapshot_path the same
+    # vectors are also saved as a local index snapshot (see vector_store.py);
+    # a snapshot is always built in full, so it ignores the checkpoint. The
+    # checkpoint only tracks what reached the Pinecone index, so a local-only
+    # run neither reads nor writes it.
+    snapshot = ([], [], []) if snapshot_path else None
+    checkpointed = index is not None
+    after_id = read_checkpoint(checkpoint_path, index_name) if checkpointed and snapshot is None else 0
+    if after_id:
+        print(f"Resuming upload after restaurant id {after_id}")
+
+    start = time.perf_counter()
+    uploaded = 0
+    in_flight = deque()
+
+    def drain_oldest():
+        nonlocal uploaded
+        vectors = in_flight.popleft().result()
+        if index is not None:
+            upsert_vectors(index, vectors)
+        if snapshot is not None:
+            for doc_id, embedding, metadata in vectors:
+                snapshot[0].append(doc_id)
+                snapshot[1].append(embedding)
+                snapshot[2].append(metadata)
+        uploaded += len(vectors)
+        if checkpointed:
+            write_checkpoint(checkpoint_path, index_name, int(vectors[-1][0]))
+        print(f"  {uploaded} vectors upserted ({uploaded / (time.perf_counter() - start):.1f}/s)")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for documents in batched(iter_documents(conn, after_id), EMBED_BATCH_SIZE):
+            # Backpressure: stop reading rows while the pipeline is full
+            while len(in_flight) >= concurrency:
+                drain_oldest()
+            in_flight.append(executor.submit(embed_documents, documents, cache))
+        while in_flight:
+            drain_oldest()
+
+    if snapshot is not None:
+        save_snapshot(snapshot_path, *snapshot)
+        print(f"Local vector snapshot written to {snapshot_path}")
+    if checkpointed and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return uploaded
+
+
+def main():
+    # Writes into the live index in place; reindex.py rebuilds into a fresh
+    # one and switches over without serving a half-updated catalogue
+    parser = argparse.ArgumentParser(description="Embed restaurants and upsert them into Pinecone")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and upload everything")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY)
+    parser.add_argument("--target", choices=["pinecone", "local", "both"], default="pinecone",
+                        help="write vectors to Pinecone, to a local snapshot (VECTOR_SNAPSHOT_PATH), or both")
+    args = parser.parse_args()
+
+    # === Initialize Pinecone client ===
+    index_name = live_index_name()
+    index = None
+    if args.target in ("pinecone", "both"):
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        index = ensure_index(pc, index_name)
+    snapshot_path = None
+    if args.target in ("local", "both"):
+        snapshot_path = live_snapshot_path()
+
+    checkpoint_path = os.getenv("UPLOAD_CHECKPOINT_PATH", "pinecone_upload.checkpoint")
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    # === Local cache of document embeddings, see embedding_cache.py ===
+    embedding_cache = EmbeddingCache()
+    conn = get_connection()
+    try:
+        uploaded = upload(index, index_name, conn, embedding_cache, checkpoint_path, args.concurrency,
+                          snapshot_path=snapshot_path)
+    finally:
+        # === Cleanup ===
+        embedding_cache.close()
+        conn.close()
+
+    # Searchers watch this version to drop cached results and reload snapshots
+    write_index_manifest(version=time.strftime("%Y%m%dT%H%M%S"), vectors=uploaded,
+                         partition_by_city=PARTITION_BY_CITY)
+    print(f"Embeddings successfully written ({uploaded} vectors, target: {args.target}).")
+    print(f"Embedding cache: {embedding_cache.hits} reused, {embedding_cache.misses} computed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import math
+import os
+import threading
+import time
+
+from db_pool import get_pool
+from keyword_index import tokenize
+from rerank import RERANK_WEIGHTS
+from vector_store import in_ranges
+
+# Query planner in front of retrieval. Chat turns often carry a city and a
+# cuisine but throwaway text ("book a table for 4 tonight"); once filler
+# words and the filter values themselves are removed nothing is left to
+# embed, so those requests are answered from per-(city, cuisine) lists
+# ranked by rating and popularity, with no embedding call or vector query.
+# Anything with real content still goes to hybrid retrieval.
+
+FILLER_WORDS = {
+    "book", "booking", "table", "tables", "reserve", "reservation", "reservations",
+    "find", "show", "suggest", "recommend", "recommendation", "recommendations",
+    "option", "options", "eat", "food", "dinner", "lunch", "breakfast", "meal",
+    "tonight", "today", "tomorrow", "now", "please", "can", "could", "you", "my",
+    "we", "us", "people", "person", "persons", "guests", "get", "need", "looking",
+    "like", "would", "let", "s", "something", "somewhere", "where", "what", "which",
+    "nice", "great", "top", "popular", "there", "this", "that", "am", "pm",
+}
+
+RANKED_LIST_SIZE = int(os.getenv("RANKED_LIST_SIZE", 100))
+
+# === Restaurants with what recommendations return, one row each ===
+RANKED_ROWS_SQL = """
+    SELECT r.id, r.name, r.city, r.cost, r.rating, r.rating_count,
+           array_agg(DISTINCT c.name) AS cuisines,
+           array_agg(DISTINCT f.name) AS features
+    FROM restaurants r
+    LEFT JOIN restaurant_cuisines rc ON r.id = rc.restaurant_id
+    LEFT JOIN cuisines c ON rc.cuisine_id = c.id
+    LEFT JOIN restaurant_features rf ON r.id = rf.restaurant_id
+    LEFT JOIN features f ON rf.feature_id = f.id
+    GROUP BY r.id;
+"""
+
+def is_low_information(user_query, city=None, cuisine=None):
+    # True when the query text says nothing beyond the city / cuisine filters
+    ignored = FILLER_WORDS | set(tokenize(city)) | set(tokenize(cuisine))
+    return not [token for token in tokenize(user_query) if token not in ignored and not token.isdigit()]
+
+
+class RankedLists:
+    # Top RANKED_LIST_SIZE restaurants per (city, cuisine), per city, per
+    # cuisine and overall (None stands for "any"), as ready-made matches
+    def __init__(self, rows, size=RANKED_LIST_SIZE):
+        rows = list(rows)
+        max_count = max((row[5] or 0 for row in rows), default=0)
+        popularity_scale = math.log1p(max_count) or 1.0
+
+        groups = {}
+        for restaurant_id, name, city, cost, rating, rating_count, cuisines, features in rows:
+            cuisines = [c for c in cuisines or [] if c]
+            score = (
+                RERANK_WEIGHTS["rating"] * (rating or 0) / 5.0
+                + RERANK_WEIGHTS["popularity"] * math.log1p(rating_count or 0) / popularity_scale
+            )
+            match = {
+                "id": str(restaurant_id),
+                "score": score,
+                "metadata": {
+                    "restaurant_id": restaurant_id,
+                    "name": name,
+                    "city": city,
+                    "cuisines": cuisines,
+                    "features": [f for f in features or [] if f],
+                },
+            }
+            for field, value in (("cost", cost), ("rating", rating), ("rating_count", rating_count)):
+                if value is not None:
+                    match["metadata"][field] = value
+            city_key = (city or "").lower()
+            keys = {(city_key, None), (None, None)}
+            for cuisine in cuisines:
+                keys.add((city_key, cuisine.lower()))
+                keys.add((None, cuisine.lower()))
+            for key in keys:
+                groups.setdefault(key, []).append(match)
+
+        self.lists = {
+            key: sorted(matches, key=lambda match: match["score"], reverse=True)[:size]
+            for key, matches in groups.items()
+        }
+        # Groups with restaurants beyond the kept list
+        self.truncated = {key for key, matches in groups.items() if len(matches) > size}
+
+    def top(self, city=None, cuisine=None, top_k=3, restaurant_ids=None, ranges=None):
+        # None when the answer may lie outside the stored list: restaurant_ids
+        # or ranges only filter the kept top RANKED_LIST_SIZE, so if fewer
+        # than top_k of those pass, the query has to go to retrieval
+        key = (city.lower() if city else None, cuisine.lower() if cuisine else None)
+        matches = self.lists.get(key, [])
+        if restaurant_ids is None and not ranges:
+            return matches[:top_k]
+        if restaurant_ids is not None:
+            matches = [match for match in matches if match["metadata"]["restaurant_id"] in restaurant_ids]
+        if ranges:
+            matches = [match for match in matches if in_ranges(match["metadata"], ranges)]
+        if len(matches) < top_k and key in self.truncated:
+            return None
+        return matches[:top_k]
+
+
+def build_ranked_lists(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(RANKED_ROWS_SQL)
+        return RankedLists(cursor.fetchall())
+
+# Rebuilt per worker at most every RANKED_LISTS_TTL seconds. While the
+# lists cannot be built, every query takes the retrieval route.
+RANKED_LISTS_TTL = float(os.getenv("RANKED_LISTS_TTL", 300))
+_ranked_lists = None
+_ranked_lists_built_at = float("-inf")
+_ranked_lists_lock = threading.Lock()
+
+def get_ranked_lists():
+    global _ranked_lists, _ranked_lists_built_at
+    if time.monotonic() - _ranked_lists_built_at >= RANKED_LISTS_TTL:
+        with _ranked_lists_lock:
+            if time.monotonic() - _ranked_lists_built_at >= RANKED_LISTS_TTL:
+                try:
+                    with get_pool().connection() as conn:
+                        _ranked_lists = build_ranked_lists(conn)
+                except Exception as e:
+                    print("Failed to build ranked lists, using retrieval for every query:", e)
+                _ranked_lists_built_at = time.monotonic()
+    return _ranked_lists
+
+# === Route counters: filter_only here, the others in pinecone_search.hybrid_search ===
+_route_lock = threading.Lock()
+route_counts = {"filter_only": 0, "keyword_only": 0, "hybrid": 0, "vector_only": 0}
+
+def count_route(route):
+    with _route_lock:
+        route_counts[route] += 1
+
+def route_stats():
+    with _route_lock:
+        return dict(route_counts)
@@ -1,5 +1,17 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+
+import requests
+
+from slot_times import parse_slot, format_slot
+from facet_index import FacetIndex
+from vector_store import PineconeStore
 from db_querries import (
+    AVAILABLE_SLOTS_SQL,
+    get_connection,
     make_booking,
     cancel_booking_by_id,
     search_bookings_by_user,
@@ -20,7 +32,7 @@ def run_tests():
     print(check_availability(restaurant_id, booking_date))
 
     print("\n=== Test 2: Make Booking ===")
-    booking_id = make_booking(restaurant_id, user_name, contact_number, email, booking_date, slot)
+    booking_id = make_booking(restaurant_id, user_name, contact_number, email, booking_date, parse_slot(slot))
     if booking_id:
         print(f"✅ Booking successful! Booking ID: {booking_id}")
     else:
@@ -29,7 +41,7 @@ def run_tests():
     print("\n=== Test 3: Search Bookings by User ===")
     bookings = search_bookings_by_user(contact_number, email)
     for b in bookings:
-        print(f"📌 Booking: ID={b[0]}, Restaurant ID={b[1]}, Name={b[2]}, Date={b[3]}, Slot={b[4]}")
+        print(f"📌 Booking: ID={b[0]}, Restaurant ID={b[1]}, Name={b[2]}, Date={b[3]}, Slot={format_slot(b[4])}")
 
     print("\n=== Test 4: Check Availability After Booking ===")
     print(check_availability(restaurant_id, booking_date))
@@ -46,5 +58,141 @@ def run_tests():
 
     close_connection()
 
+def run_booking_stress(total_requests=2000, concurrency=200):
+    # Fire many parallel /book calls at one slot of a running API and check
+    # that the slot is filled exactly to capacity, never oversold. Start the
+    # API first (uvicorn app:app).
+    api_url = os.getenv("API_URL", "http://127.0.0.1:8000")
+    restaurant_id = 45
+    slot = "8:00 PM"
+    booking_date = date(2025, 6, 7)
+    party_size = 2
+
+    # The slot can hold as many parties as its remaining covers allow
+    remaining = dict(check_availability(restaurant_id, booking_date)).get(parse_slot(slot), 0)
+    expected_winners = remaining // party_size
+
+    print(f"=== Stress: {total_requests} concurrent /book calls, {concurrency} in flight ===")
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def book(i):
+        res = session.post(f"{api_url}/book", json={
+            "restaurant_id": restaurant_id,
+            "contact_name": f"Stress Tester {i}",
+            "contact_number": f"90000{i:05d}",
+            "contact_email": f"stress{i}@example.com",
+            "date": booking_date.isoformat(),
+            "slot": slot,
+            "number_of_people": party_size
+        })
+        return res.status_code, res.json()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(book, range(total_requests)))
+    elapsed = time.perf_counter() - start
+
+    winners = [body for status, body in results if status == 200 and body.get("success")]
+    errors = [body for status, body in results if status != 200]
+    print(f"Finished in {elapsed:.2f}s ({total_requests / elapsed:.0f} req/s)")
+    print(f"Successful bookings: {len(winners)}, rejected: {total_requests - len(winners) - len(errors)}, errors: {len(errors)}")
+
+    # Clean up so the stress run can be repeated
+    for body in winners:
+        cancel_booking_by_id(body["booking_id"])
+    close_connection()
+
+    assert not errors, f"Unexpected errors, e.g. {errors[0]}"
+    assert len(winners) == expected_winners, f"Expected {expected_winners} winning bookings, got {len(winners)}"
+    print(f"✅ Slot filled to capacity by exactly {expected_winners} bookings.")
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+def run_explain_check():
+    # Regression check for the availability query plan. With sequential scans
+    # disabled the planner must still find an index path for every table, and
+    # the bookings table must not appear in the plan at all; on a small dev
+    # database a seq scan would otherwise win on cost alone.
+    print("=== EXPLAIN: availability query ===")
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SET LOCAL enable_seqscan = off;")
+        cursor.execute("EXPLAIN (FORMAT JSON) " + AVAILABLE_SLOTS_SQL, {
+            "restaurant_id": 45,
+            "date": date(2025, 6, 6),
+            "party_size": 1,
+        })
+        plan = cursor.fetchone()[0][0]["Plan"]
+        cursor.close()
+        conn.rollback()
+
+    scans = [
+        (node["Node Type"], node.get("Relation Name"), node.get("Index Name"))
+        for node in plan_nodes(plan)
+        if "Relation Name" in node
+    ]
+    for node_type, relation, index_name in scans:
+        print(f"  {node_type} on {relation}" + (f" using {index_name}" if index_name else ""))
+
+    seq_scans = [relation for node_type, relation, _ in scans if node_type == "Seq Scan"]
+    assert not seq_scans, f"Availability query falls back to a sequential scan on: {seq_scans}"
+    assert "bookings" not in {relation for _, relation, _ in scans}, "Availability query scans bookings"
+    close_connection()
+    print("✅ Availability is served from indexes only.")
+
+def run_prefilter_cap_check(catalogue_size=5000):
+    # A broad facet prefilter must not be sent to Pinecone as one huge $in
+    # list; above PineconeStore.MAX_ID_FILTER ids the store over-fetches and
+    # filters the matches itself. Runs against a recording fake index, so
+    # no Pinecone or database access is needed.
+    print("=== Facet prefilter above the $in cap ===")
+    index = FacetIndex(
+        (i, "Goa", 400 if i % 2 else 900, 4.0, 10, ["Italian"], []) for i in range(1, catalogue_size + 1)
+    )
+    budget_ids = index.restaurant_ids({"cost_band": "budget"})
+    assert budget_ids == list(range(1, catalogue_size + 1, 2)), "restaurant_ids returned the wrong ids"
+
+    class Match:
+        def __init__(self, restaurant_id):
+            self.id = str(restaurant_id)
+            self.score = 1.0 - restaurant_id / (catalogue_size + 1)
+            self.metadata = {"restaurant_id": float(restaurant_id)}   # Pinecone returns numbers as floats
+
+    class FakeIndex:
+        def __init__(self):
+            self.calls = []
+
+        def query(self, vector, top_k, namespace, filter, include_metadata):
+            self.calls.append({"top_k": top_k, "filter": filter})
+            return type("Results", (), {"matches": [Match(i) for i in range(1, top_k + 1)]})()
+
+    fake = FakeIndex()
+    store = PineconeStore(fake)
+    assert len(budget_ids) > store.MAX_ID_FILTER, "catalogue too small to exceed the cap"
+    matches = store.query([0.1] * 8, top_k=10, cuisine="Italian", restaurant_ids=budget_ids)
+
+    sent = fake.calls[0]
+    assert "restaurant_id" not in (sent["filter"] or {}), "id list above the cap was sent to Pinecone"
+    assert sent["filter"] == {"cuisines": {"$in": ["Italian"]}}, f"Unexpected filter {sent['filter']}"
+    assert sent["top_k"] == min(10 * store.PREFILTER_OVERFETCH, store.MAX_TOP_K), "prefilter was not over-fetched"
+    assert [m["id"] for m in matches] == [str(i) for i in range(1, 20, 2)], "matches were not post-filtered"
+
+    small = budget_ids[:5]
+    store.query([0.1] * 8, top_k=3, restaurant_ids=small)
+    assert fake.calls[1]["filter"] == {"restaurant_id": {"$in": small}}, "small id lists should go to Pinecone"
+    assert fake.calls[1]["top_k"] == 3
+    print(f"✅ {len(budget_ids)} prefiltered ids were post-filtered; small lists still use $in.")
+
 if __name__ == "__main__":
-    run_tests()
+    if len(sys.argv) > 1 and sys.argv[1] == "stress":
+        run_booking_stress()
+    elif len(sys.argv) > 1 and sys.argv[1] == "explain":
+        run_explain_check()
+    elif len(sys.argv) > 1 and sys.argv[1] == "prefilter":
+        run_prefilter_cap_check()
+    else:
+        run_tests()
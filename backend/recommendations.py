@@ -0,0 +1,98 @@
+import json
+import os
+
+from cache import TTLCache, SingleFlight
+from facet_index import get_facet_index
+from pinecone_search import hybrid_search, normalize_query, normalize_text, current_index_version
+from rerank import rerank, RERANK_CANDIDATES
+from query_planner import is_low_information, get_ranked_lists, count_route, route_stats
+
+# Low-information queries ("book a table" plus a city / cuisine) take their
+# candidates from query_planner's precomputed ranked lists, unless facet or
+# range filters leave too few of a list's restaurants; everything else goes
+# through hybrid retrieval. Either way RERANK_CANDIDATES candidates are
+# fetched and rerank.py picks the top_k by similarity, rating, popularity and
+# price fit.
+#
+# Results of identical (query, city, cuisine, top_k) requests are cached per
+# worker, and concurrent identical misses share one retrieval (keyword index,
+# embedding and vector query; see pinecone_search.hybrid_search).
+# Keys carry the vector index version, and the cache is emptied when a
+# re-index bumps it, so results never outlive the index they came from.
+
+recommendation_cache = TTLCache(
+    maxsize=int(os.getenv("RECOMMENDATION_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL", 300))
+)
+recommendation_flights = SingleFlight()
+
+# With a date, /recommendations ranks this many candidates and keeps the
+# first top_k that have a free slot, checked in one batched availability
+# query (see bookable). Availability itself is never cached here.
+AVAILABILITY_CANDIDATES = int(os.getenv("RECOMMEND_AVAILABILITY_CANDIDATES", 30))
+_cached_version = None
+
+def recommend(user_query, city=None, cuisine=None, top_k=3, filters=None, budget=None, ranges=None):
+    # filters: optional facet filter (see facet_index.py) used to prefilter
+    # the candidates before retrieval; budget: cost for two, for price fit;
+    # ranges: cost / rating / rating_count ranges applied inside the vector
+    # store (see vector_store.py)
+    global _cached_version
+    version = current_index_version()
+    if version != _cached_version:
+        recommendation_cache.clear()
+        _cached_version = version
+
+    # Every low-information phrasing of the same filters shares one entry
+    low_information = is_low_information(user_query, city, cuisine)
+    query_key = "" if low_information else normalize_query(user_query)
+    key = (version, query_key, normalize_text(city), normalize_text(cuisine), top_k,
+           json.dumps(filters, sort_keys=True) if filters else None, budget,
+           tuple(sorted(ranges.items())) if ranges else None)
+    results = recommendation_cache.get(key)
+    if results is not None:
+        return results
+
+    def compute():
+        restaurant_ids = get_facet_index().restaurant_ids(filters) if filters else None
+        if restaurant_ids == []:
+            results = []
+        else:
+            ranked_lists = get_ranked_lists() if low_information else None
+            candidates = None
+            if ranked_lists is not None:
+                candidates = ranked_lists.top(
+                    normalize_text(city), normalize_text(cuisine), max(top_k, RERANK_CANDIDATES),
+                    set(restaurant_ids) if restaurant_ids is not None else None, ranges
+                )
+            if candidates is not None:
+                count_route("filter_only")
+            else:
+                candidates = hybrid_search(user_query, city_filter=city, cuisine_filter=cuisine,
+                                           top_k=max(top_k, RERANK_CANDIDATES), restaurant_ids=restaurant_ids,
+                                           min_results=top_k, ranges=ranges)
+            try:
+                results = rerank(candidates, get_facet_index(), top_k, budget=budget)
+            except Exception as e:
+                print("Re-ranking failed, using retrieval order:", e)
+                results = candidates[:top_k]
+        recommendation_cache.set(key, results)
+        return results
+
+    return recommendation_flights.do(key, compute)
+
+def bookable(matches, grid, date, top_k=3):
+    # First top_k matches with free slots in an availability grid
+    # ({(restaurant_id, date): [(start_minute, remaining)]}), each with its
+    # slots under "slots"
+    results = []
+    for match in matches:
+        slots = grid.get((int(match["id"]), date))
+        if slots:
+            results.append(dict(match, slots=slots))
+            if len(results) == top_k:
+                break
+    return results
+
+def recommendation_stats():
+    return dict(recommendation_cache.stats(), single_flight=recommendation_flights.stats(), routes=route_stats())
@@ -0,0 +1,184 @@
+import argparse
+import os
+import time
+
+from pinecone import Pinecone
+from embedding_cache import EmbeddingCache
+from pinecone_upload import (
+    EMBEDDING_MODEL, EMBED_CONCURRENCY, PARTITION_BY_CITY,
+    ensure_index, get_connection, upload,
+)
+from restaurant_documents import iter_documents
+from vector_store import (
+    NumpyStore, PineconeStore, read_index_manifest, write_index_manifest,
+    live_index_name, live_snapshot_path, partition_by_city_enabled, INDEX_POLL_SECONDS,
+)
+
+# Blue/green re-index. The catalogue is embedded into a fresh Pinecone index
+# (and/or local snapshot) while searchers keep using the live one. The new
+# one is validated, and only then does the manifest (the alias searchers
+# read, see vector_store.live_index_name) switch to it in a single atomic
+# write. The old index is deleted once every worker has had time to notice
+# the switch. A failed run never touches what is being served.
+#
+#   python reindex.py --target both
+#   python reindex.py --keep-old          # keep the old index for rollback
+
+VALIDATION_SAMPLES = int(os.getenv("REINDEX_VALIDATION_SAMPLES", 50))
+MIN_SELF_HIT_RATE = float(os.getenv("REINDEX_MIN_SELF_HIT_RATE", 0.95))
+COUNT_TIMEOUT = float(os.getenv("REINDEX_COUNT_TIMEOUT", 300))   # Pinecone counts are eventually consistent
+# Workers see the switch within one manifest poll; queries already running
+# against the old index get RETIRE_MARGIN more seconds before it is deleted
+RETIRE_MARGIN = float(os.getenv("REINDEX_RETIRE_MARGIN", 30))
+MIN_GRACE = INDEX_POLL_SECONDS + RETIRE_MARGIN
+
+# Restaurants build_document embeds (it skips those without a description)
+DOCUMENT_COUNT_SQL = "SELECT count(*) FROM restaurants WHERE description IS NOT NULL AND description <> '';"
+
+def staged_names(manifest, base_index_name, base_snapshot_path, restart):
+    # Resume the index a failed run was building, unless asked to restart
+    staging = manifest.get("staging") or {}
+    if staging and not restart:
+        print(f"Resuming staged re-index {staging['version']}")
+        return staging
+    version = time.strftime("%Y%m%d%H%M%S")
+    root, ext = os.path.splitext(base_snapshot_path)
+    return {
+        "version": version,
+        "index_name": f"{base_index_name}-{version}",
+        "snapshot_path": f"{root}-{version}{ext or '.npz'}",
+    }
+
+def sample_documents(conn, cache, total, samples):
+    # Every n-th document with its cached embedding, to query the new index
+    step = max(1, total // max(1, samples))
+    picked = []
+    for position, (doc_id, text, metadata) in enumerate(iter_documents(conn)):
+        if position % step == 0:
+            embedding = cache.get(EMBEDDING_MODEL, text)
+            if embedding is not None:
+                picked.append((doc_id, embedding, metadata))
+        if len(picked) >= samples:
+            break
+    return picked
+
+def wait_for_count(index, expected):
+    deadline = time.monotonic() + COUNT_TIMEOUT
+    while True:
+        count = index.describe_index_stats().total_vector_count
+        if count >= expected or time.monotonic() >= deadline:
+            return count
+        time.sleep(5)
+
+def validate(store, label, count, expected_count, samples, live_store=None):
+    # The index must hold every document, and every sampled restaurant should
+    # come back as its own nearest neighbour
+    if count == 0 or count < expected_count:
+        raise RuntimeError(f"{label}: {count} vectors, expected {expected_count}")
+    self_hits, overlap = 0, []
+    for doc_id, embedding, metadata in samples:
+        matches = store.query(embedding, top_k=5, city=metadata.get("city"))
+        ids = [match["id"] for match in matches]
+        if ids and ids[0] == doc_id:
+            self_hits += 1
+        if live_store is not None:
+            live_ids = [match["id"] for match in live_store.query(embedding, top_k=5, city=metadata.get("city"))]
+            overlap.append(len(set(ids) & set(live_ids)) / max(1, len(live_ids)))
+
+    rate = self_hits / len(samples) if samples else 1.0
+    print(f"{label}: {count} vectors, self-retrieval {rate:.1%} on {len(samples)} samples"
+          + (f", top-5 overlap with live {sum(overlap) / len(overlap):.1%}" if overlap else ""))
+    if rate < MIN_SELF_HIT_RATE:
+        raise RuntimeError(f"{label}: self-retrieval {rate:.1%} is below {MIN_SELF_HIT_RATE:.0%}")
+
+def retire(pc, old_index_name, old_snapshot_path, new_index_name, new_snapshot_path):
+    if pc is not None and old_index_name and old_index_name != new_index_name:
+        if old_index_name in pc.list_indexes().names():
+            pc.delete_index(old_index_name)
+            print(f"Deleted old index {old_index_name}")
+    if old_snapshot_path and old_snapshot_path != new_snapshot_path:
+        for path in (old_snapshot_path, old_snapshot_path + ".f32.npy"):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"Removed old snapshot {old_snapshot_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the vector index into a fresh index and switch over")
+    parser.add_argument("--target", choices=["pinecone", "local", "both"], default="pinecone")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY)
+    parser.add_argument("--restart", action="store_true", help="abandon a staged re-index and start a new one")
+    parser.add_argument("--keep-old", action="store_true", help="do not delete the previous index / snapshot")
+    parser.add_argument("--grace", type=float, default=float(os.getenv("REINDEX_RETIRE_GRACE", MIN_GRACE)),
+                        help="seconds to keep the old index after the switch "
+                             "(at least VECTOR_INDEX_POLL_SECONDS + REINDEX_RETIRE_MARGIN)")
+    args = parser.parse_args()
+    if args.grace < MIN_GRACE and not args.keep_old:
+        parser.error(f"--grace must be at least {MIN_GRACE:g}s: workers poll the manifest every "
+                     f"{INDEX_POLL_SECONDS:g}s and may still be querying the old index")
+
+    manifest = read_index_manifest()
+    old_index_name, old_snapshot_path = live_index_name(), live_snapshot_path()
+    old_partition_by_city = partition_by_city_enabled()
+    staging = staged_names(
+        manifest, os.getenv("PINECONE_INDEX_NAME"), os.getenv("VECTOR_SNAPSHOT_PATH", "vector_snapshot.npz"),
+        args.restart
+    )
+    write_index_manifest(staging=staging)
+
+    use_pinecone = args.target in ("pinecone", "both")
+    use_local = args.target in ("local", "both")
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY")) if use_pinecone else None
+    index = ensure_index(pc, staging["index_name"]) if use_pinecone else None
+    snapshot_path = staging["snapshot_path"] if use_local else None
+    checkpoint_path = os.getenv("REINDEX_CHECKPOINT_PATH", "reindex.checkpoint")
+
+    # === Build (the live index keeps serving) ===
+    embedding_cache = EmbeddingCache()
+    conn = get_connection()
+    try:
+        # Counted before the build: restaurants added while it runs are not
+        # required in the new index (the next re-index picks them up)
+        with conn.cursor() as cursor:
+            cursor.execute(DOCUMENT_COUNT_SQL)
+            expected = cursor.fetchone()[0]
+        upload(index, staging["index_name"], conn, embedding_cache, checkpoint_path,
+               args.concurrency, snapshot_path=snapshot_path)
+
+        # === Validate before anything is switched ===
+        samples = sample_documents(conn, embedding_cache, expected, VALIDATION_SAMPLES)
+        if use_pinecone:
+            live = None
+            if old_index_name in pc.list_indexes().names():
+                live = PineconeStore(pc.Index(old_index_name), partition_by_city=old_partition_by_city)
+            validate(PineconeStore(index, partition_by_city=PARTITION_BY_CITY), staging["index_name"],
+                     wait_for_count(index, expected), expected, samples, live)
+        if use_local:
+            local = NumpyStore.load(snapshot_path)
+            validate(local, snapshot_path, len(local), expected, samples)
+    finally:
+        embedding_cache.close()
+        conn.close()
+
+    # === Switch: one atomic manifest write; searchers pick it up on their next poll ===
+    switched = {"version": staging["version"], "vectors": expected, "staging": None,
+                "previous_index_name": old_index_name, "previous_snapshot_path": old_snapshot_path}
+    if use_pinecone:
+        switched["index_name"] = staging["index_name"]
+        switched["partition_by_city"] = PARTITION_BY_CITY
+    if use_local:
+        switched["snapshot_path"] = staging["snapshot_path"]
+    write_index_manifest(**switched)
+    print(f"Switched to re-index {staging['version']}")
+
+    # === Retire the old index once workers have moved over ===
+    if args.keep_old:
+        print(f"Kept {old_index_name} / {old_snapshot_path} for rollback")
+        return
+    time.sleep(args.grace)
+    retire(pc, old_index_name if use_pinecone else None, old_snapshot_path if use_local else None,
+           staging["index_name"], staging["snapshot_path"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+# Second stage for recommendations: retrieval over-fetches RERANK_CANDIDATES
+# matches and they are re-scored as a weighted blend of
+#   similarity  retrieval score, min-max scaled over the candidates
+#   rating      rating / 5
+#   popularity  log(1 + rating_count), scaled by the catalogue maximum
+#   price_fit   1 within the budget, falling off as (budget / cost)^2 above
+#               it; only used when a budget is given
+# Everything is computed as array operations over the candidate set.
+# Weights come from RERANK_WEIGHTS, e.g. "similarity=0.6,rating=0.2,popularity=0.1,price_fit=0.1".
+
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 100))
+DEFAULT_WEIGHTS = {"similarity": 0.6, "rating": 0.2, "popularity": 0.1, "price_fit": 0.1}
+
+def parse_weights(text):
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in weights:
+            raise ValueError(f"Unknown re-ranking weight: {name!r}")
+        weights[name] = float(value)
+    return weights
+
+RERANK_WEIGHTS = parse_weights(os.getenv("RERANK_WEIGHTS"))
+
+def _fill_missing(values, fallback):
+    return np.where(np.isnan(values), fallback, values)
+
+def rerank(matches, attributes, top_k=3, budget=None, weights=None):
+    # matches: {"id", "score", "metadata"} dicts from retrieval; attributes:
+    # a facet_index.FacetIndex (row_of plus rating / rating_count / cost
+    # columns). Returns the top_k matches with "score" set to the blend.
+    if not matches:
+        return []
+    weights = weights or RERANK_WEIGHTS
+
+    rows = np.array([attributes.row_of.get(int(match["id"]), -1) for match in matches])
+    known = rows >= 0
+    rows = np.where(known, rows, 0)
+
+    similarity = np.array([match["score"] for match in matches], dtype=np.float64)
+    spread = similarity.max() - similarity.min()
+    similarity = (similarity - similarity.min()) / spread if spread > 0 else np.ones_like(similarity)
+
+    # Unknown restaurants and missing values score as the catalogue average
+    nan = np.full(len(matches), np.nan)
+    rating = np.where(known, attributes.rating[rows], nan) if len(attributes) else nan
+    rating_count = np.where(known, attributes.rating_count[rows], nan) if len(attributes) else nan
+    cost = np.where(known, attributes.cost[rows], nan) if len(attributes) else nan
+
+    mean_rating = np.nanmean(attributes.rating) if np.any(~np.isnan(attributes.rating)) else 0.0
+    rating = _fill_missing(rating, mean_rating) / 5.0
+
+    has_counts = np.any(~np.isnan(attributes.rating_count))
+    mean_count = np.nanmean(attributes.rating_count) if has_counts else 0.0
+    max_popularity = np.log1p(np.nanmax(attributes.rating_count)) if has_counts else 0.0
+    popularity = np.log1p(_fill_missing(rating_count, mean_count))
+    popularity = popularity / max_popularity if max_popularity > 0 else np.zeros_like(popularity)
+
+    blended = (
+        weights["similarity"] * similarity
+        + weights["rating"] * rating
+        + weights["popularity"] * popularity
+    )
+    if budget:
+        cost = _fill_missing(cost, budget)
+        price_fit = np.where(cost <= budget, 1.0, (budget / np.maximum(cost, 1)) ** 2)
+        blended += weights["price_fit"] * price_fit
+
+    if len(blended) > top_k:
+        best = np.argpartition(-blended, top_k - 1)[:top_k]
+    else:
+        best = np.arange(len(blended))
+    best = best[np.argsort(-blended[best], kind="stable")]
+    return [dict(matches[i], score=float(blended[i])) for i in best]
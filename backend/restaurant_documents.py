@@ -0,0 +1,63 @@
+import os
+
+# One searchable document per restaurant: the text pinecone_upload.py embeds
+# and keyword_index.py indexes, with the metadata both return. Kept apart
+# from the uploader so the API workers can build their indexes without
+# importing the embedding / Pinecone clients.
+
+FETCH_SIZE = int(os.getenv("UPLOAD_FETCH_SIZE", 500))   # rows per server-side cursor round trip
+
+# === Restaurant data with cuisines and features, one row per restaurant ===
+RESTAURANT_DOCUMENTS_SQL = """
+    SELECT r.id, r.name, r.city, r.description, r.cost, r.rating, r.rating_count,
+           array_agg(DISTINCT c.name) AS cuisines,
+           array_agg(DISTINCT f.name) AS features
+    FROM restaurants r
+    LEFT JOIN restaurant_cuisines rc ON r.id = rc.restaurant_id
+    LEFT JOIN cuisines c ON rc.cuisine_id = c.id
+    LEFT JOIN restaurant_features rf ON r.id = rf.restaurant_id
+    LEFT JOIN features f ON rf.feature_id = f.id
+    WHERE r.id > %s
+    GROUP BY r.id
+    ORDER BY r.id;
+"""
+
+def build_document(row):
+    # (id, text to embed, metadata) for a restaurant row, or None if it has
+    # nothing to embed
+    restaurant_id, name, city, description, cost, rating, rating_count, cuisines, features = row
+
+    if not description:
+        return None
+
+    cuisines = [c for c in cuisines or [] if c]
+    features = [f for f in features or [] if f]
+    cuisines_str = ", ".join(cuisines)
+    features_str = ", ".join(features)
+
+    combined_text = f"{description}\nCuisines: {cuisines_str}\nFeatures: {features_str}"
+
+    metadata = {
+        "restaurant_id": restaurant_id,
+        "name": name,
+        "city": city,
+        "cuisines": cuisines,
+        "features": features,
+    }
+    # Range-filterable values (vector_store.RANGE_FIELDS); Pinecone metadata
+    # cannot hold nulls, so missing ones are left out
+    for field, value in (("cost", cost), ("rating", rating), ("rating_count", rating_count)):
+        if value is not None:
+            metadata[field] = value
+    return str(restaurant_id), combined_text, metadata
+
+def iter_documents(conn, after_id=0):
+    # Named cursor: rows are pulled from the server FETCH_SIZE at a time
+    # instead of materialising the whole catalogue with fetchall().
+    with conn.cursor(name="restaurant_documents") as cursor:
+        cursor.itersize = FETCH_SIZE
+        cursor.execute(RESTAURANT_DOCUMENTS_SQL, (after_id,))
+        for row in cursor:
+            document = build_document(row)
+            if document:
+                yield document
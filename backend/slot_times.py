@@ -0,0 +1,32 @@
+import re
+
+# Slots are stored as minutes since midnight (SMALLINT). These helpers convert
+# between that and the "7:30 PM" labels used in restaurants.json and the UI.
+
+_SLOT_RE = re.compile(r"^\s*(\d{1,2})(?:[:.](\d{2}))?\s*([AaPp])\.?\s*[Mm]?\.?\s*$|^\s*(\d{1,2}):(\d{2})\s*$")
+
+def parse_slot(text):
+    # "7:30 PM", "7 pm", "7:30PM" or 24-hour "19:30" -> 1170
+    match = _SLOT_RE.match(text or "")
+    if not match:
+        raise ValueError(f"Unrecognised time slot: {text!r}")
+
+    if match.group(4) is not None:
+        hour, minute = int(match.group(4)), int(match.group(5))
+        if hour > 23:
+            raise ValueError(f"Unrecognised time slot: {text!r}")
+    else:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Unrecognised time slot: {text!r}")
+        hour = hour % 12 + (12 if match.group(3).lower() == "p" else 0)
+
+    if minute > 59:
+        raise ValueError(f"Unrecognised time slot: {text!r}")
+    return hour * 60 + minute
+
+def format_slot(minutes):
+    # 1170 -> "7:30 PM"
+    hour, minute = divmod(minutes, 60)
+    suffix = "PM" if hour >= 12 else "AM"
+    return f"{hour % 12 or 12}:{minute:02d} {suffix}"
@@ -3,6 +3,7 @@ import datetime
 from db_querries import make_booking, cancel_booking_by_id, check_availability, search_bookings_by_user
 from ai_agent import extract_intent_entities
 from pinecone_search import query_pinecone
+from slot_times import format_slot
 import re
 
 def parse_entities(json_str):
@@ -131,8 +132,8 @@ def main():
                 continue
 
             print("\n🕒 Available Slots:")
-            for i, slot in enumerate(available_slots, 1):
-                print(f"{i}. {slot}")
+            for i, (slot, remaining) in enumerate(available_slots, 1):
+                print(f"{i}. {format_slot(slot)} ({remaining} seats left)")
 
             # Prompt for remaining fields with validation
             other_fields = {
@@ -148,7 +149,7 @@ def main():
             while True:
                 slot_choice = input("Choose a slot number: ").strip()
                 if slot_choice.isdigit() and 1 <= int(slot_choice) <= len(available_slots):
-                    slot = available_slots[int(slot_choice) - 1]
+                    slot = available_slots[int(slot_choice) - 1][0]
                     break
                 else:
                     print("Invalid choice, please select a valid slot number.")
@@ -159,7 +160,8 @@ def main():
                 contact_number=entities["contact_number"],
                 email=entities["contact_email"],
                 date=booking_date,
-                slot=slot
+                start_minute=slot,
+                party_size=int(entities["number_of_people"])
             )
             if booking_id:
                 print(f"\n✅ Booking confirmed! Your booking ID is: {booking_id}")
@@ -185,7 +187,7 @@ def main():
                 print(f"  Restaurant ID: {b[1]}")
                 print(f"  Name: {b[2]}")
                 print(f"  Date: {b[3]}")
-                print(f"  Time Slot: {b[4]}\n")
+                print(f"  Time Slot: {format_slot(b[4])}\n")
 
             # Ask for booking ID to cancel
             booking_id = ask_for_missing("booking_id", "Please enter the Booking ID you want to cancel: ")
@@ -0,0 +1,89 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from vector_store import NumpyStore, QuantizedStore, live_snapshot_path
+
+# Recall / latency report for the compact in-memory vector stores: every
+# QuantizedStore configuration is compared with exact float32 search
+# (NumpyStore) on the same queries. Queries are catalogue vectors with
+# noise added, so no embedding API calls are needed.
+#
+#   python vector_benchmark.py                      # live local snapshot
+#   python vector_benchmark.py --synthetic 50000    # generated catalogue
+
+def load_catalogue(path):
+    with np.load(path, allow_pickle=False) as snapshot:
+        return snapshot["ids"].tolist(), snapshot["vectors"], json.loads(str(snapshot["metadata"]))
+
+def synthetic_catalogue(size, dimension=768, seed=0):
+    # Embeddings are far from isotropic; a low-rank signal plus noise is a
+    # closer stand-in than plain Gaussian vectors
+    rng = np.random.default_rng(seed)
+    latent = rng.standard_normal((size, 64)).astype(np.float32)
+    basis = rng.standard_normal((64, dimension)).astype(np.float32)
+    vectors = latent @ basis + 0.5 * rng.standard_normal((size, dimension)).astype(np.float32)
+    cities = ["Bangalore", "Delhi", "Goa", "Mumbai", "Panipat", "Sonipat"]
+    metadata = [{"restaurant_id": i, "city": cities[i % len(cities)], "cuisines": []} for i in range(size)]
+    return [str(i) for i in range(size)], vectors, metadata
+
+def make_queries(vectors, count, noise, seed=1):
+    rng = np.random.default_rng(seed)
+    picked = np.asarray(vectors, dtype=np.float32)[rng.choice(len(vectors), size=count)]
+    scale = np.linalg.norm(picked, axis=1, keepdims=True) / np.sqrt(picked.shape[1])
+    return picked + noise * scale * rng.standard_normal(picked.shape).astype(np.float32)
+
+def run_queries(store, queries, top_k, city):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        matches = store.query(query, top_k=top_k, city=city)
+        latencies.append(time.perf_counter() - start)
+        results.append([match["id"] for match in matches])
+    return results, np.array(latencies) * 1000
+
+def recall(results, expected):
+    hits = sum(len(set(got) & set(want)) for got, want in zip(results, expected))
+    return hits / max(1, sum(len(want) for want in expected))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare quantized / reduced vector search with full precision")
+    parser.add_argument("--snapshot", default=live_snapshot_path())
+    parser.add_argument("--synthetic", type=int, default=0, help="generate a catalogue of this size instead")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=1.0, help="query noise relative to vector scale")
+    parser.add_argument("--dims", default="0,256,128", help="comma separated PCA sizes, 0 = no reduction")
+    parser.add_argument("--city", default=None, help="also filter every query by this city")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        ids, vectors, metadata = synthetic_catalogue(args.synthetic)
+    else:
+        ids, vectors, metadata = load_catalogue(args.snapshot)
+    queries = make_queries(vectors, args.queries, args.noise)
+    print(f"{len(ids)} vectors x {np.asarray(vectors).shape[1]} dims, {len(queries)} queries, top {args.top_k}")
+
+    baseline = NumpyStore(ids, vectors, metadata)
+    expected, latencies = run_queries(baseline, queries, args.top_k, args.city)
+    full_bytes = baseline.vectors.shape[1] * 4
+    print(f"{'store':<22}{'bytes/vec':>10}{'recall':>9}{'mean ms':>9}{'p95 ms':>9}{'build s':>9}")
+    print(f"{'float32 (exact)':<22}{full_bytes:>10}{1.0:>9.3f}{latencies.mean():>9.2f}"
+          f"{np.percentile(latencies, 95):>9.2f}{'-':>9}")
+
+    for dims in [int(d) for d in args.dims.split(",")]:
+        for precision in ("float16", "int8"):
+            start = time.perf_counter()
+            store = QuantizedStore(ids, vectors, metadata, precision=precision, dims=dims or None)
+            build_seconds = time.perf_counter() - start
+            results, latencies = run_queries(store, queries, args.top_k, args.city)
+            label = precision + (f" / pca {dims}" if dims else "")
+            print(f"{label:<22}{store.bytes_per_vector():>10}{recall(results, expected):>9.3f}"
+                  f"{latencies.mean():>9.2f}{np.percentile(latencies, 95):>9.2f}{build_seconds:>9.1f}")
+    print("Recall is measured after exact float re-scoring of each store's shortlist "
+          f"(max(top_k x {QuantizedStore.RESCORE_FACTOR}, {QuantizedStore.RESCORE_MIN}) rows).")
+
+
+if __name__ == "__main__":
+    main()
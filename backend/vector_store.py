@@ -0,0 +1,533 @@
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Vector stores behind query_pinecone. All backends take the same city /
+# cuisine filters, an optional list of allowed restaurant ids (e.g. a
+# facet_index.py prefilter) and optional numeric ranges over RANGE_FIELDS,
+# {"cost": (None, 800), "rating": (4, None)} with inclusive bounds, and
+# return matches as {"id", "score", "metadata"} dicts. Ranges are applied
+# inside the store, so a selective query still returns top_k matches.
+#
+#   VECTOR_STORE_BACKEND=pinecone  the hosted Pinecone index (default)
+#   VECTOR_STORE_BACKEND=numpy     exact in-process search over a local snapshot;
+#                                  VECTOR_PRECISION=float16|int8 and/or
+#                                  VECTOR_REDUCED_DIMS=N keep compact codes
+#                                  instead (QuantizedStore)
+#   VECTOR_STORE_BACKEND=hnsw      approximate in-process search (needs hnswlib)
+#
+# VECTOR_PARTITION_BY_CITY=1 partitions the index by city: one Pinecone
+# namespace or one HNSW graph per city, so a city query only searches that
+# city and a query without one fans out over the partitions in parallel.
+#
+# Local snapshots are written by `pinecone_upload.py --target local|both`.
+# Every successful upload also bumps the version in the index manifest
+# (VECTOR_INDEX_MANIFEST), which is how searchers notice a re-index.
+
+RANGE_FIELDS = ("cost", "rating", "rating_count")
+
+def in_ranges(metadata, ranges):
+    # Python-side check of the same ranges, for indexes outside this module.
+    # Restaurants missing a ranged value never match.
+    for field, (low, high) in (ranges or {}).items():
+        value = metadata.get(field)
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
+
+def city_namespace(city):
+    # Partition (Pinecone namespace) holding a city's vectors
+    return re.sub(r"[^a-z0-9]+", "-", (city or "").lower()).strip("-") or "unknown"
+
+# Shared by every partitioned query that fans out over several partitions
+_fanout_executor = ThreadPoolExecutor(max_workers=int(os.getenv("VECTOR_FANOUT_WORKERS", 8)))
+
+def fan_out(func, partitions):
+    # func(partition) -> matches, run in parallel when there is more than one
+    partitions = list(partitions)
+    if len(partitions) <= 1:
+        return [func(partition) for partition in partitions]
+    return list(_fanout_executor.map(func, partitions))
+
+def merge_top_k(match_lists, top_k):
+    matches = [match for matches in match_lists for match in matches]
+    return sorted(matches, key=lambda match: match["score"], reverse=True)[:top_k]
+
+
+class PineconeStore:
+    # With partition_by_city each city's vectors live in their own namespace
+    # (city_namespace): a city query searches only that namespace, and a
+    # query without a city fans out to every namespace in parallel.
+    # Pinecone limits the size of $in lists and of the request, so an id
+    # prefilter above MAX_ID_FILTER ids (a broad facet such as
+    # cost_band=budget) is not sent: PREFILTER_OVERFETCH x top_k matches are
+    # fetched instead and filtered against the ids here.
+    MAX_ID_FILTER = int(os.getenv("PINECONE_MAX_ID_FILTER", 1000))
+    PREFILTER_OVERFETCH = int(os.getenv("PINECONE_PREFILTER_OVERFETCH", 10))
+    MAX_TOP_K = 1000   # Pinecone's top_k limit when metadata is included
+
+    def __init__(self, index, partition_by_city=False):
+        self.index = index
+        self.partition_by_city = partition_by_city
+        self._namespaces = None
+
+    def namespaces(self):
+        if self._namespaces is None:
+            self._namespaces = list(self.index.describe_index_stats().namespaces)
+        return self._namespaces
+
+    def _query_namespace(self, namespace, vector, top_k, filters):
+        results = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            filter=filters if filters else None,
+            include_metadata=True
+        )
+        return [
+            {"id": match.id, "score": match.score, "metadata": match.metadata or {}}
+            for match in results.matches
+        ]
+
+    def query(self, vector, top_k=3, city=None, cuisine=None, restaurant_ids=None, ranges=None):
+        filters = {}
+        if city and not self.partition_by_city:
+            filters["city"] = {"$eq": city}
+        if cuisine:
+            filters["cuisines"] = {"$in": [cuisine]}
+        allowed, fetch_k = None, top_k
+        if restaurant_ids is not None and len(restaurant_ids) > self.MAX_ID_FILTER:
+            allowed = {int(i) for i in restaurant_ids}
+            fetch_k = min(max(top_k, top_k * self.PREFILTER_OVERFETCH), self.MAX_TOP_K)
+        elif restaurant_ids is not None:
+            filters["restaurant_id"] = {"$in": list(restaurant_ids)}
+        for field, (low, high) in (ranges or {}).items():
+            bounds = {}
+            if low is not None:
+                bounds["$gte"] = low
+            if high is not None:
+                bounds["$lte"] = high
+            if bounds:
+                filters[field] = bounds
+
+        if not self.partition_by_city:
+            matches = self._query_namespace("", vector, fetch_k, filters)
+        elif city:
+            matches = self._query_namespace(city_namespace(city), vector, fetch_k, filters)
+        else:
+            matches = merge_top_k(fan_out(
+                lambda namespace: self._query_namespace(namespace, vector, fetch_k, filters), self.namespaces()
+            ), fetch_k)
+        if allowed is not None:
+            matches = [match for match in matches if int(match["metadata"].get("restaurant_id", -1)) in allowed]
+        return matches[:top_k]
+
+
+class NumpyStore:
+    # Brute-force cosine search: vectors are L2-normalised once at load time so
+    # a query is one matrix-vector product over the rows the filters allow.
+    # Rows are kept grouped by city, so a city is one contiguous block that is
+    # scored through a view instead of a gathered copy.
+    def __init__(self, ids, vectors, metadata):
+        self._index_metadata(ids, metadata)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(self._order):
+            vectors = vectors[self._order]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms == 0, 1, norms)
+
+    def _index_metadata(self, ids, metadata):
+        metadata = list(metadata)
+        order = sorted(range(len(metadata)), key=lambda row: metadata[row].get("city") or "")
+        ids = list(ids)
+        self._order = np.array(order, dtype=np.int64)   # row -> row in the snapshot
+        self.ids = [ids[row] for row in order]
+        self.metadata = [metadata[row] for row in order]
+
+        # Filter masks, built once per distinct value
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._city_rows = {}
+        self._cuisine_rows = {}
+        for row, meta in enumerate(self.metadata):
+            self._city_rows.setdefault(meta.get("city"), []).append(row)
+            for cuisine in meta.get("cuisines") or []:
+                self._cuisine_rows.setdefault(cuisine, []).append(row)
+        self._city_rows = {k: np.array(v) for k, v in self._city_rows.items()}
+        self._cuisine_rows = {k: np.array(v) for k, v in self._cuisine_rows.items()}
+        # city -> (first row, last row + 1)
+        self._city_blocks = {k: (int(v[0]), int(v[-1]) + 1) for k, v in self._city_rows.items()}
+        # Numeric columns for range filters, NaN where a value is missing
+        self._columns = {
+            field: np.array([
+                np.nan if meta.get(field) is None else meta[field] for meta in self.metadata
+            ], dtype=np.float64)
+            for field in RANGE_FIELDS
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as snapshot:
+            return cls(
+                snapshot["ids"].tolist(),
+                snapshot["vectors"],
+                json.loads(str(snapshot["metadata"]))
+            )
+
+    def candidate_rows(self, city=None, cuisine=None, restaurant_ids=None, ranges=None):
+        # Row numbers passing the filters, or None when nothing is filtered
+        rows = None
+        if city:
+            rows = self._city_rows.get(city, np.array([], dtype=int))
+        if cuisine:
+            cuisine_rows = self._cuisine_rows.get(cuisine, np.array([], dtype=int))
+            rows = cuisine_rows if rows is None else np.intersect1d(rows, cuisine_rows, assume_unique=True)
+        if restaurant_ids is not None:
+            id_rows = np.unique(np.array(
+                [self._row_of[str(i)] for i in restaurant_ids if str(i) in self._row_of], dtype=int
+            ))
+            rows = id_rows if rows is None else np.intersect1d(rows, id_rows, assume_unique=True)
+        if ranges:
+            mask = np.ones(len(self.ids), dtype=bool)
+            for field, (low, high) in ranges.items():
+                column = self._columns[field]
+                mask &= ~np.isnan(column)
+                if low is not None:
+                    mask &= column >= low
+                if high is not None:
+                    mask &= column <= high
+            range_rows = np.flatnonzero(mask)
+            rows = range_rows if rows is None else np.intersect1d(rows, range_rows, assume_unique=True)
+        return rows
+
+    def _normalise(self, vector):
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def _top_k(self, rows, scores, top_k):
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        return [
+            {"id": self.ids[rows[i]], "score": float(scores[i]), "metadata": self.metadata[rows[i]]}
+            for i in best
+        ]
+
+    def query(self, vector, top_k=3, city=None, cuisine=None, restaurant_ids=None, ranges=None):
+        query = self._normalise(vector)
+        rows = self.candidate_rows(city, cuisine, restaurant_ids, ranges)
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        if len(rows) == 0 or top_k <= 0:
+            return []
+        return self._top_k(rows, self._scores(rows, query), top_k)
+
+    def _scores(self, rows, query):
+        # rows are sorted and unique; a contiguous run (a whole city) is a view
+        if rows[-1] - rows[0] + 1 == len(rows):
+            return self.vectors[rows[0]:rows[-1] + 1] @ query
+        return self.vectors[rows] @ query
+
+
+class HNSWStore(NumpyStore):
+    # Approximate nearest neighbours over HNSW graphs (hnswlib). Selective
+    # filters leave too few graph neighbours to walk, so when the filtered
+    # candidate set is small the exact NumPy path is used instead. With
+    # partition_by_city there is one graph per city: a city query walks only
+    # its graph and a query without a city fans out over all of them.
+    def __init__(self, ids, vectors, metadata, m=16, ef_construction=200, ef_search=64,
+                 exact_below=2000, partition_by_city=False):
+        super().__init__(ids, vectors, metadata)
+        try:
+            import hnswlib
+        except ImportError:
+            raise RuntimeError("VECTOR_STORE_BACKEND=hnsw requires the hnswlib package (pip install hnswlib)")
+
+        self.exact_below = exact_below
+        self.partition_by_city = partition_by_city
+        blocks = self._city_blocks if partition_by_city else {None: (0, len(self.ids))}
+        self.graphs = {}
+        for city, (start, end) in blocks.items():
+            graph = hnswlib.Index(space="cosine", dim=self.vectors.shape[1])
+            graph.init_index(max_elements=max(end - start, 1), M=m, ef_construction=ef_construction)
+            if end > start:
+                graph.add_items(self.vectors[start:end], np.arange(start, end))
+            graph.set_ef(ef_search)
+            self.graphs[city] = (graph, start, end)
+
+    def _query_graph(self, target, query, top_k, rows):
+        graph, start, end = target
+        if rows is None:
+            available, allowed = end - start, None
+        else:
+            in_block = rows[(rows >= start) & (rows < end)]
+            available = len(in_block)
+            # Only pay for the filter callback when it excludes something
+            allowed = None if available == end - start else set(in_block.tolist()).__contains__
+        k = min(top_k, available)
+        if k <= 0:
+            return []
+        labels, distances = graph.knn_query(query, k=k, filter=allowed)
+        return [
+            {"id": self.ids[row], "score": float(1 - distance), "metadata": self.metadata[row]}
+            for row, distance in zip(labels[0], distances[0])
+        ]
+
+    def query(self, vector, top_k=3, city=None, cuisine=None, restaurant_ids=None, ranges=None):
+        rows = self.candidate_rows(city, cuisine, restaurant_ids, ranges)
+        if rows is not None and len(rows) < self.exact_below:
+            return super().query(vector, top_k, city, cuisine, restaurant_ids, ranges)
+
+        query = self._normalise(vector)
+        if not self.partition_by_city:
+            targets = [self.graphs[None]]
+        elif city:
+            targets = [self.graphs[city]] if city in self.graphs else []
+        else:
+            targets = list(self.graphs.values())
+        return merge_top_k(fan_out(lambda target: self._query_graph(target, query, top_k, rows), targets), top_k)
+
+
+class QuantizedStore(NumpyStore):
+    # Compact in-memory copy of the catalogue for workers that cannot afford
+    # 3 KB of float32 per restaurant: vectors are optionally reduced to
+    # `dims` dimensions with PCA, then kept as float32, float16 or int8
+    # (symmetric, one scale per dimension). Queries score the compact codes, take the
+    # best max(top_k * RESCORE_FACTOR, RESCORE_MIN) rows and re-score those
+    # exactly against full float32 vectors, which can be a memory-mapped file
+    # (see full_vectors_file) so they stay out of the worker's heap. The codes
+    # are built from those vectors BUILD_ROWS at a time, so loading never
+    # holds the full-precision matrix in memory, only a block of it.
+    RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", 10))
+    RESCORE_MIN = int(os.getenv("VECTOR_RESCORE_MIN", 50))
+    BLOCK_ROWS = 512    # codes are widened to float32 a cache-sized block at a time
+    BUILD_ROWS = 4096   # full vectors read per block while building the codes
+
+    def __init__(self, ids, vectors, metadata, precision="int8", dims=None, full_vectors=None):
+        if precision not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported vector precision: {precision!r}")
+        self._index_metadata(ids, metadata)
+        # Full vectors in snapshot order, as given or memory-mapped
+        self.full_vectors = np.asarray(vectors, dtype=np.float32) if full_vectors is None else full_vectors
+        self.precision = precision
+        self.vectors = None   # only the codes stay in memory
+        self._local = threading.local()   # per-thread scoring buffer
+        dimension = self.full_vectors.shape[1] if self.full_vectors.ndim == 2 else 0
+
+        self.mean = self.components = None
+        if dims and dims < dimension and len(self._order) > dims:
+            # Principal axes of the catalogue, from a covariance matrix summed
+            # block by block. The mean shifts every score by the same
+            # q . mean, so ranking only needs the centred projection.
+            total = np.zeros(dimension, dtype=np.float64)
+            products = np.zeros((dimension, dimension), dtype=np.float64)
+            for block in self._normalised_blocks():
+                total += block.sum(axis=0)
+                products += block.T @ block
+            mean = total / len(self._order)
+            _, axes = np.linalg.eigh(products / len(self._order) - np.outer(mean, mean))
+            self.mean = mean.astype(np.float32)
+            self.components = np.ascontiguousarray(axes[:, ::-1][:, :dims].T, dtype=np.float32)
+            dimension = dims
+
+        self.scale = None
+        if precision == "int8":
+            # One pass for the per-dimension range, a second to encode
+            peak = np.zeros(dimension, dtype=np.float32)
+            for block in self._normalised_blocks():
+                np.maximum(peak, np.abs(self._project(block)).max(axis=0), out=peak)
+            self.scale = np.where(peak == 0, 1, peak / 127).astype(np.float32)
+
+        self.codes = np.empty((len(self._order), dimension), dtype=precision)
+        start = 0
+        for block in self._normalised_blocks():
+            projected = self._project(block)
+            if self.scale is not None:
+                projected = np.round(projected / self.scale)
+            self.codes[start:start + len(block)] = projected
+            start += len(block)
+
+    def _normalised(self, snapshot_rows):
+        # L2-normalised float32 copies of the given (sorted) snapshot rows
+        block = np.asarray(self.full_vectors[snapshot_rows], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        return block / np.where(norms == 0, 1, norms)
+
+    def _normalised_blocks(self):
+        # Normalised vectors in store order, BUILD_ROWS at a time; each block
+        # is read in snapshot order so a memory map is read sequentially
+        for start in range(0, len(self._order), self.BUILD_ROWS):
+            rows = self._order[start:start + self.BUILD_ROWS]
+            by_offset = np.argsort(rows)
+            block = np.empty((len(rows), self.full_vectors.shape[1]), dtype=np.float32)
+            block[by_offset] = self._normalised(rows[by_offset])
+            yield block
+
+    def _project(self, block):
+        if self.components is None:
+            return block
+        return (block - self.mean) @ self.components.T
+
+    @classmethod
+    def load(cls, path, precision="int8", dims=None):
+        full_vectors = full_vectors_file(path)
+        with np.load(path, allow_pickle=False) as snapshot:
+            return cls(
+                snapshot["ids"].tolist(),
+                full_vectors,
+                json.loads(str(snapshot["metadata"])),
+                precision=precision,
+                dims=dims,
+                full_vectors=full_vectors
+            )
+
+    def bytes_per_vector(self):
+        return self.codes.shape[1] * self.codes.itemsize if len(self.codes) else 0
+
+    def _block_buffer(self):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty((self.BLOCK_ROWS, self.codes.shape[1]), dtype=np.float32)
+        return buffer
+
+    def _approximate_scores(self, rows, query):
+        if self.components is not None:
+            query = self.components @ query
+        if self.scale is not None:
+            query = query * self.scale
+        query = query.astype(np.float32)
+
+        contiguous = rows[-1] - rows[0] + 1 == len(rows)
+        scores = np.empty(len(rows), dtype=np.float32)
+        buffer = self._block_buffer()
+        for start in range(0, len(rows), self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, len(rows))
+            if contiguous:
+                block = self.codes[rows[0] + start:rows[0] + end]
+            else:
+                block = self.codes[rows[start:end]]
+            widened = buffer[:end - start]
+            np.copyto(widened, block, casting="unsafe")
+            scores[start:end] = widened @ query
+        return scores
+
+    def query(self, vector, top_k=3, city=None, cuisine=None, restaurant_ids=None, ranges=None):
+        query = self._normalise(vector)
+        rows = self.candidate_rows(city, cuisine, restaurant_ids, ranges)
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        if len(rows) == 0 or top_k <= 0:
+            return []
+
+        approximate = self._approximate_scores(rows, query)
+        shortlist = min(len(rows), max(top_k * self.RESCORE_FACTOR, self.RESCORE_MIN))
+        if shortlist < len(rows):
+            rows = rows[np.argpartition(-approximate, shortlist - 1)[:shortlist]]
+
+        # Exact cosine on the shortlist, gathered in snapshot order so reads
+        # from a memory map move forward through the file
+        snapshot_rows = self._order[rows]
+        by_offset = np.argsort(snapshot_rows)
+        rows = rows[by_offset]
+        return self._top_k(rows, self._normalised(snapshot_rows[by_offset]) @ query, top_k)
+
+
+def full_vectors_file(snapshot_path):
+    # float32 copy of a snapshot's vectors as a plain .npy next to it, opened
+    # as a memory map; rewritten whenever the snapshot is newer
+    path = snapshot_path + ".f32.npy"
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(snapshot_path):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        with np.load(snapshot_path, allow_pickle=False) as snapshot:
+            np.save(tmp_path, np.asarray(snapshot["vectors"], dtype=np.float32))
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+def save_snapshot(path, ids, vectors, metadata):
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        ids=np.array(ids),
+        vectors=np.asarray(vectors, dtype=np.float32),
+        metadata=np.array(json.dumps(metadata))
+    )
+    os.replace(tmp_path, path)
+
+
+# How often searchers re-read the manifest (pinecone_search.current_index_version)
+INDEX_POLL_SECONDS = float(os.getenv("VECTOR_INDEX_POLL_SECONDS", 5))
+
+
+def manifest_path():
+    return os.getenv("VECTOR_INDEX_MANIFEST", "vector_index.json")
+
+
+def read_index_manifest():
+    try:
+        with open(manifest_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_index_manifest(**fields):
+    manifest = dict(read_index_manifest(), **fields)
+    tmp_path = manifest_path() + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path())
+    return manifest
+
+
+# The manifest is also the alias for blue/green re-indexing (reindex.py):
+# index_name / snapshot_path name the live Pinecone index and local
+# snapshot, falling back to PINECONE_INDEX_NAME / VECTOR_SNAPSHOT_PATH.
+def live_index_name():
+    return read_index_manifest().get("index_name") or os.getenv("PINECONE_INDEX_NAME")
+
+
+def live_snapshot_path():
+    return read_index_manifest().get("snapshot_path") or os.getenv("VECTOR_SNAPSHOT_PATH", "vector_snapshot.npz")
+
+
+def partition_by_city_enabled():
+    # The uploader records its layout in the manifest; before the first
+    # upload, VECTOR_PARTITION_BY_CITY decides
+    manifest = read_index_manifest()
+    if "partition_by_city" in manifest:
+        return bool(manifest["partition_by_city"])
+    return os.getenv("VECTOR_PARTITION_BY_CITY", "0") == "1"
+
+
+def create_vector_store(backend=None, snapshot_path=None):
+    backend = backend or os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+    snapshot_path = snapshot_path or live_snapshot_path()
+    partition_by_city = partition_by_city_enabled()
+
+    if backend == "pinecone":
+        from pinecone import Pinecone
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        return PineconeStore(pc.Index(live_index_name()), partition_by_city=partition_by_city)
+    if backend == "numpy":
+        precision = os.getenv("VECTOR_PRECISION", "float32")
+        dims = int(os.getenv("VECTOR_REDUCED_DIMS", 0)) or None
+        if precision == "float32" and dims is None:
+            return NumpyStore.load(snapshot_path)
+        return QuantizedStore.load(snapshot_path, precision=precision, dims=dims)
+    if backend == "hnsw":
+        with np.load(snapshot_path, allow_pickle=False) as snapshot:
+            return HNSWStore(
+                snapshot["ids"].tolist(), snapshot["vectors"], json.loads(str(snapshot["metadata"])),
+                partition_by_city=partition_by_city
+            )
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {backend!r}")